@@ -0,0 +1,146 @@
+"""Local stand-in for the OpenWeather geocoding and forecast APIs.
+
+Serves the recorded payloads in ``fixtures/`` with configurable latency and
+error injection, so the API can be benchmarked without spending real quota:
+
+    python bench/fake_openweather.py --port 9100 --latency-ms 120 --error-rate 0.01
+    OPENWEATHER_BASE_URL=http://127.0.0.1:9100 OPENWEATHER_API_KEY=bench uvicorn main:app
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _load(name: str):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeOpenWeather:
+    """Configuration + counters shared by all request handlers."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.geocode = _load("geocode.json")
+        self.forecast = _load("forecast.json")
+        self.counts = {"geocode": 0, "forecast": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._rng.random() < self.error_rate
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def geocode_results(self, q: str, limit: int) -> list:
+        name = q.split(",")[0].strip()
+        hit = self.geocode.get(name.lower())
+        if hit is None:
+            # Unknown places get a stable synthetic location inside India
+            digest = hashlib.sha1(name.lower().encode()).digest()
+            lat = 8.0 + digest[0] / 255 * 24.0
+            lon = 69.0 + digest[1] / 255 * 27.0
+            hit = [{"name": name.title(), "lat": round(lat, 4), "lon": round(lon, 4), "country": "IN", "state": "Bench"}]
+        return hit[:limit]
+
+    def forecast_payload(self, lat: float, lon: float) -> dict:
+        body = copy.deepcopy(self.forecast)
+        body["city"]["coord"] = {"lat": lat, "lon": lon}
+        return body
+
+
+def make_handler(state: FakeOpenWeather):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+            time.sleep(state.delay())
+            if state.should_fail():
+                state.count("errors")
+                return self._send(state.error_status, {"cod": state.error_status, "message": "injected error"})
+            if url.path == "/geo/1.0/direct":
+                state.count("geocode")
+                return self._send(200, state.geocode_results(qs.get("q", ""), int(qs.get("limit", 5))))
+            if url.path == "/data/2.5/forecast":
+                state.count("forecast")
+                try:
+                    lat, lon = float(qs["lat"]), float(qs["lon"])
+                except (KeyError, ValueError):
+                    return self._send(400, {"cod": "400", "message": "wrong latitude"})
+                return self._send(200, state.forecast_payload(lat, lon))
+            if url.path == "/_stats":
+                return self._send(200, state.counts)
+            return self._send(404, {"cod": "404", "message": "not found"})
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, **config) -> tuple:
+    """Start the fake server on a background thread; returns (server, state)."""
+    state = FakeOpenWeather(**config)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openweather", daemon=True).start()
+    return server, state
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="added delay per request")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="+/- uniform jitter on the delay")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail (0..1)")
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    server, _ = serve(
+        args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+    )
+    print(f"fake OpenWeather on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
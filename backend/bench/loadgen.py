@@ -0,0 +1,221 @@
+"""Closed-loop load driver for the CropWise API.
+
+Runs ``--concurrency`` workers against a running server for ``--duration``
+seconds, picking routes by the weights in ``--mix``, and prints p50/p95/p99
+latency, RPS, error rate and mean bytes on the wire per route; ``--compare``
+adds the change against a report saved earlier with ``--json``:
+
+    python bench/loadgen.py --base-url http://127.0.0.1:8000 --concurrency 32 \
+        --mix season_now=4,live_crops=4,geocode=1,login=1 --compare bench_before.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROUTES = ("season_now", "live_crops", "geocode", "login", "states")
+DEFAULT_MIX = "season_now=4,live_crops=4,geocode=1,login=1"
+DEFAULT_PLACES = ["Guntur", "Vijayawada", "Warangal", "Nashik", "Ludhiana",
+                  "Coimbatore", "Mysuru", "Indore", "Patna", "Jaipur"]
+SEASONS = ["Kharif", "Rabi", "Summer", None]
+BENCH_USER = ("bench-user", "bench-password")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"unknown route {name!r}; choose from {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_ms: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_ms:
+        return None
+    k = max(0, min(len(sorted_ms) - 1, math.ceil(pct / 100 * len(sorted_ms)) - 1))
+    return round(sorted_ms[k], 2)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.bytes: Dict[str, int] = {}
+
+    def add(self, route: str, ms: float, status: str, ok: bool, nbytes: int = 0) -> None:
+        self.latencies.setdefault(route, []).append(ms)
+        self.bytes[route] = self.bytes.get(route, 0) + nbytes
+        self.statuses.setdefault(route, {}).setdefault(status, 0)
+        self.statuses[route][status] += 1
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route, lat in sorted(self.latencies.items()):
+            lat = sorted(lat)
+            routes[route] = {
+                "requests": len(lat),
+                "rps": round(len(lat) / elapsed, 1),
+                "error_rate": round(self.errors.get(route, 0) / len(lat), 4),
+                "p50_ms": percentile(lat, 50),
+                "p95_ms": percentile(lat, 95),
+                "p99_ms": percentile(lat, 99),
+                "avg_bytes": round(self.bytes.get(route, 0) / len(lat)),  # body as sent, i.e. compressed
+                "statuses": self.statuses[route],
+            }
+        total = sum(r["requests"] for r in routes.values())
+        errors = sum(self.errors.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "rps": round(total / elapsed, 1) if elapsed else None,
+            "error_rate": round(errors / total, 4) if total else None,
+            "routes": routes,
+        }
+
+
+def build_request(route: str, places: List[str], rng: random.Random):
+    place = rng.choice(places)
+    if route == "season_now":
+        return "GET", "/season_now", {"params": {"state": place}}
+    if route == "live_crops":
+        season = rng.choice(SEASONS)
+        params = {"state": place}
+        if season:
+            params["season"] = season
+        return "GET", "/live_crops", {"params": params}
+    if route == "geocode":
+        return "GET", "/geocode", {"params": {"query": place}}
+    if route == "login":
+        return "POST", "/auth/login", {"data": {"username": BENCH_USER[0], "password": BENCH_USER[1]}}
+    return "GET", "/states", {}
+
+
+async def ensure_bench_user(client: httpx.AsyncClient) -> None:
+    r = await client.post("/auth/signup", json={"username": BENCH_USER[0], "password": BENCH_USER[1]})
+    if r.status_code not in (200, 400):  # 400: already exists
+        raise RuntimeError(f"could not create bench user: {r.status_code} {r.text}")
+
+
+async def run_load(base_url: str, mix: Dict[str, float], concurrency: int, duration: float,
+                   places: List[str], warmup: float = 0.0, seed: Optional[int] = None,
+                   timeout: float = 30.0) -> dict:
+    routes, weights = zip(*mix.items())
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        if "login" in mix:
+            await ensure_bench_user(client)
+
+        async def worker(i: int, until: float, record: bool) -> None:
+            rng = random.Random(None if seed is None else seed + i)
+            while time.perf_counter() < until:
+                route = rng.choices(routes, weights)[0]
+                method, path, kwargs = build_request(route, places, rng)
+                start = time.perf_counter()
+                nbytes = 0
+                try:
+                    r = await client.request(method, path, **kwargs)
+                    status, ok, nbytes = str(r.status_code), r.status_code < 400, r.num_bytes_downloaded
+                except httpx.HTTPError as e:
+                    status, ok = type(e).__name__, False
+                if record:
+                    rec.add(route, (time.perf_counter() - start) * 1000, status, ok, nbytes)
+
+        if warmup > 0:
+            until = time.perf_counter() + warmup
+            await asyncio.gather(*[worker(i, until, False) for i in range(concurrency)])
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(i, start + duration, True) for i in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return rec.report(elapsed)
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'route':<12} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'bytes':>7}"]
+    for route, r in report["routes"].items():
+        lines.append(
+            f"{route:<12} {r['requests']:>7} {r['rps']:>8} {r['error_rate'] * 100:>6.2f} "
+            f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r.get('avg_bytes', '-'):>7}"
+        )
+    lines.append(
+        f"total: {report['requests']} requests in {report['elapsed_s']}s, "
+        f"{report['rps']} rps, error rate {(report['error_rate'] or 0) * 100:.2f}% (latencies in ms)"
+    )
+    return "\n".join(lines)
+
+
+def _change(before, after) -> str:
+    if not isinstance(before, (int, float)) or not isinstance(after, (int, float)) or not before:
+        return "-"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def format_comparison(before: dict, after: dict) -> str:
+    """Per-route change from a saved report (negative latency/bytes and positive rps are better)."""
+    keys = ("rps", "p50_ms", "p95_ms", "p99_ms", "avg_bytes")
+    lines = [f"{'vs before':<12} " + " ".join(f"{k:>9}" for k in keys)]
+    for route, r in after["routes"].items():
+        old = before["routes"].get(route)
+        if old is not None:
+            lines.append(f"{route:<12} " + " ".join(f"{_change(old.get(k), r.get(k)):>9}" for k in keys))
+    lines.append(f"{'total':<12} {_change(before.get('rps'), after.get('rps')):>9}")
+    return "\n".join(lines)
+
+
+def add_load_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    ap.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before the run")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"route=weight list from {', '.join(ROUTES)}")
+    ap.add_argument("--places", default=",".join(DEFAULT_PLACES), help="comma-separated place names")
+    ap.add_argument("--unique-places", type=int, default=0,
+                    help="add N synthetic places to exercise cache misses")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--json", dest="json_out", default=None, help="also write the report to this file")
+    ap.add_argument("--compare", default=None, help="a previous --json report to print the change against")
+
+
+def places_from_args(args) -> List[str]:
+    places = [p.strip() for p in args.places.split(",") if p.strip()]
+    places += [f"Benchgram {i}" for i in range(args.unique_places)]
+    return places
+
+
+def emit(report: dict, json_out: Optional[str], compare: Optional[str] = None) -> None:
+    print(format_report(report))
+    if compare:
+        with open(compare, encoding="utf-8") as f:
+            print(format_comparison(json.load(f), report))
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--base-url", default="http://127.0.0.1:8000")
+    add_load_args(ap)
+    args = ap.parse_args()
+    report = asyncio.run(run_load(
+        args.base_url, parse_mix(args.mix), args.concurrency, args.duration,
+        places_from_args(args), warmup=args.warmup, seed=args.seed,
+    ))
+    emit(report, args.json_out, args.compare)
+
+
+if __name__ == "__main__":
+    main()
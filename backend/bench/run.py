@@ -0,0 +1,100 @@
+"""End-to-end benchmark: fake OpenWeather + a real API server + the load driver.
+
+Starts the fake upstream in-process, launches the app under uvicorn (or
+gunicorn with ``--workers``) against a throwaway SQLite database, runs the
+load mix and prints the per-route report:
+
+    cd backend
+    python bench/run.py --concurrency 32 --duration 30 --upstream-latency-ms 150
+    python bench/run.py --json bench_before.json   # keep reports to compare runs
+    python bench/run.py --compare bench_before.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import fake_openweather
+import loadgen
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API server exited with code {proc.returncode}")
+        try:
+            if httpx.get(base_url + "/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("API server did not become ready")
+
+
+def start_api(port: int, env: dict, workers: int) -> subprocess.Popen:
+    if workers > 1:
+        cmd = [sys.executable, "-m", "gunicorn", "-k", "uvicorn.workers.UvicornWorker", "main:app",
+               "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workers", type=int, default=1, help=">1 runs gunicorn with N uvicorn workers")
+    ap.add_argument("--upstream-latency-ms", type=float, default=100.0)
+    ap.add_argument("--upstream-jitter-ms", type=float, default=20.0)
+    ap.add_argument("--upstream-error-rate", type=float, default=0.0)
+    loadgen.add_load_args(ap)
+    args = ap.parse_args()
+
+    upstream, upstream_state = fake_openweather.serve(
+        latency_ms=args.upstream_latency_ms, jitter_ms=args.upstream_jitter_ms,
+        error_rate=args.upstream_error_rate, seed=args.seed,
+    )
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="cropwise-bench-") as tmp:
+        env = dict(
+            os.environ,
+            OPENWEATHER_BASE_URL=f"http://127.0.0.1:{upstream.server_port}",
+            OPENWEATHER_API_KEY="bench",
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        )
+        proc = start_api(port, env, args.workers)
+        try:
+            _wait_ready(base_url, proc)
+            report = asyncio.run(loadgen.run_load(
+                base_url, loadgen.parse_mix(args.mix), args.concurrency, args.duration,
+                loadgen.places_from_args(args), warmup=args.warmup, seed=args.seed,
+            ))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=15)
+            upstream.shutdown()
+    report["upstream_calls"] = dict(upstream_state.counts)
+    loadgen.emit(report, args.json_out, args.compare)
+    print(f"upstream calls: {report['upstream_calls']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""gunicorn settings, read from the working directory (render.yaml runs gunicorn in backend/)."""
+import subprocess
+import sys
+
+
+def on_starting(server):
+    # Migrate once before any worker boots. This runs in a child process so the
+    # master never imports the app: workers must not inherit its DB connections.
+    subprocess.run([sys.executable, "-c", "import main; main.create_db_and_tables()"], check=True)
@@ -1,29 +1,301 @@
 from __future__ import annotations
 
+import abc
+import ast
+import asyncio
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import math
+import multiprocessing
 import os
+import random
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Hashable, NamedTuple, Tuple
+from email.utils import formatdate, parsedate_to_datetime
 from urllib.parse import quote
 
-import requests
+import anyio
+import httpx
+import numpy as np
+import orjson
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
-from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, and_, bindparam, event, func, or_, update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlmodel import SQLModel, Field, Session, create_engine, select
 
+import passwords
+
+try:
+    import brotli  # optional: "br" Content-Encoding when installed
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # POSIX: serializes migrations and analytics maintenance across worker processes
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger("cropwise")
+
 APP_TITLE = "CropWise – Real-Time Crop Calendar & Guidance System"
 SECRET_KEY = os.getenv("CROPWISE_SECRET", "dev-secret-change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))  # seconds
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))  # seconds
+UPSTREAM_MAX_PER_HOST = int(os.getenv("UPSTREAM_MAX_PER_HOST", "20"))  # pooled connections
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # bcrypt processes per app worker
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))  # running + queued
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))  # seconds
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))  # seconds, capped by token exp
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))  # tokens
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", "1800"))  # seconds
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "2048"))  # entries
+FORECAST_CACHE_PRECISION = int(os.getenv("FORECAST_CACHE_PRECISION", "2"))  # decimals (~1 km)
+FORECAST_STEP_HOURS = 3  # OpenWeather 5 day / 3 hour forecast
+FORECAST_DEFAULT_HORIZON = 72  # hours summarized when the caller doesn't pick one
+FORECAST_MAX_HORIZON = 120  # hours; the whole 5-day series
+PLACE_HITS_FLUSH_INTERVAL = float(os.getenv("PLACE_HITS_FLUSH_INTERVAL", "15"))  # seconds
+RULES_VERSION_CHECK_INTERVAL = float(os.getenv("RULES_VERSION_CHECK_INTERVAL", "5"))  # seconds
+AUTH_VERSION_CHECK_INTERVAL = float(os.getenv("AUTH_VERSION_CHECK_INTERVAL", "5"))  # seconds
+PLACES_PAGE_DEFAULT = int(os.getenv("PLACES_PAGE_DEFAULT", "50"))  # /states rows per page
+PLACES_PAGE_MAX = int(os.getenv("PLACES_PAGE_MAX", "500"))
+PLACES_MAX_AGE = int(os.getenv("PLACES_MAX_AGE", "60"))  # Cache-Control for /states, seconds
+PLACE_SNAP_KM = float(os.getenv("PLACE_SNAP_KM", "0"))  # reuse a cached place this close to a new geocode; 0 = off
+PLACE_INDEX_REFRESH_INTERVAL = float(os.getenv("PLACE_INDEX_REFRESH_INTERVAL", "5"))  # seconds
+NEARBY_RADIUS_DEFAULT = float(os.getenv("NEARBY_RADIUS_DEFAULT", "10"))  # km
+NEARBY_RADIUS_MAX = float(os.getenv("NEARBY_RADIUS_MAX", "100"))  # km
+GAZETTEER_PATH = os.getenv(  # optional CSV of name,state,lat,lon served by /geocode
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv"))
+GEOCODE_LOCAL_SCAN = int(os.getenv("GEOCODE_LOCAL_SCAN", "1000"))  # prefix matches ranked per query
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "1") == "1"
+WARMER_INTERVAL = float(os.getenv("WARMER_INTERVAL", "600"))  # seconds between cycles
+WARMER_JITTER = float(os.getenv("WARMER_JITTER", "0.2"))  # +/- fraction of the interval
+WARMER_TOP_N = int(os.getenv("WARMER_TOP_N", "50"))  # places by PlaceCache.hits
+WARMER_MAX_UPSTREAM = int(os.getenv("WARMER_MAX_UPSTREAM", "20"))  # forecast calls per cycle
+LIVE_CROPS_BATCH_MAX = int(os.getenv("LIVE_CROPS_BATCH_MAX", "100"))  # items per request
+LIVE_CROPS_BATCH_CONCURRENCY = int(os.getenv("LIVE_CROPS_BATCH_CONCURRENCY", "8"))  # upstream fan-out
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))  # seconds
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))  # rows per INSERT
+ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", "50000"))  # queued rows
+ANALYTICS_BULK_MAX = int(os.getenv("ANALYTICS_BULK_MAX", "500"))  # events per request
+ANALYTICS_META_MAX_LEN = 200  # chars kept from meta place/season for rollups
+ANALYTICS_HOT_MONTHS = int(os.getenv("ANALYTICS_HOT_MONTHS", "3"))  # months kept as SQLite partitions
+ANALYTICS_RETENTION_MONTHS = int(os.getenv("ANALYTICS_RETENTION_MONTHS", "0"))  # months kept at all; 0 = forever
+ANALYTICS_MAINTENANCE_INTERVAL = float(os.getenv("ANALYTICS_MAINTENANCE_INTERVAL", "3600"))  # seconds
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))  # bytes buffered per streamed chunk
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))  # smaller JSON bodies are sent uncompressed
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))  # 1-9
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # 0-11
 
 DB_PATH = "auth_analytics.db"
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # connections per app worker
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds waiting for a connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+# Monthly analytics partitions; default: an "analytics" directory next to the SQLite file
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR") or os.path.join(
+    os.path.dirname(DATABASE_URL[len("sqlite:///"):]) if DATABASE_URL.startswith("sqlite:///") else "", "analytics")
+
+
+# ---------------------------
+# Storage (engine, SQLite pragmas)
+# ---------------------------
+def _sqlite_on_connect(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")  # readers no longer block the writer
+    cur.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")  # wait for the lock instead of failing
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cur.close()
+
+
+def make_engine(url: str) -> Engine:
+    kwargs: Dict[str, Any] = {}
+    is_sqlite = url.startswith("sqlite")
+    if is_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if not (is_sqlite and (":memory:" in url or url.rstrip("/") == "sqlite:")):
+        # In-memory SQLite uses a single shared connection; file/server DBs get a sized pool
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    eng = create_engine(url, **kwargs)
+    if is_sqlite:
+        event.listen(eng, "connect", _sqlite_on_connect)
+    return eng
+
+
+engine = make_engine(DATABASE_URL)
+
+
+# ---------------------------
+# Metrics (Prometheus text format)
+# ---------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Minimal in-process registry: counters, histograms and callback gauges.
+
+    Recording is a dict update under one lock; formatting only happens when
+    /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._hists: Dict[str, Dict[LabelSet, list]] = {}  # labels -> [bucket counts..., sum, count]
+        self._gauges: Dict[str, Callable[[], List[Tuple[LabelSet, float]]]] = {}
+
+    def counter(self, name: str, help: str) -> None:
+        self._meta[name] = ("counter", help)
+        self._counters[name] = {}
+
+    def histogram(self, name: str, help: str) -> None:
+        self._meta[name] = ("histogram", help)
+        self._hists[name] = {}
+
+    def gauge(self, name: str, help: str, collect: Callable[[], List[Tuple[LabelSet, float]]],
+              kind: str = "gauge") -> None:
+        """Sampled at scrape time; ``kind="counter"`` for monotonic values kept elsewhere."""
+        self._meta[name] = (kind, help)
+        self._gauges[name] = collect
+
+    def inc(self, name: str, labels: LabelSet = (), value: float = 1.0) -> None:
+        series = self._counters[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, labels: LabelSet, seconds: float) -> None:
+        series = self._hists[name]
+        i = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            h = series.get(labels)
+            if h is None:
+                h = series[labels] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            if i < len(LATENCY_BUCKETS):
+                h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    @staticmethod
+    def _fmt(labels: LabelSet, extra: LabelSet = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            hists = {n: {k: list(v) for k, v in s.items()} for n, s in self._hists.items()}
+        for name, (kind, help) in self._meta.items():
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            if name in counters:
+                for labels, v in counters[name].items():
+                    out.append(f"{name}{self._fmt(labels)} {v}")
+            elif name in hists:
+                for labels, h in hists[name].items():
+                    cumulative = 0
+                    for bound, n in zip(LATENCY_BUCKETS, h):
+                        cumulative += n
+                        out.append(f"{name}_bucket{self._fmt(labels, (('le', repr(bound)),))} {cumulative}")
+                    out.append(f"{name}_bucket{self._fmt(labels, (('le', '+Inf'),))} {h[-1]}")
+                    out.append(f"{name}_sum{self._fmt(labels)} {h[-2]}")
+                    out.append(f"{name}_count{self._fmt(labels)} {h[-1]}")
+            else:
+                try:
+                    samples = self._gauges[name]()
+                except Exception:
+                    samples = []
+                for labels, v in samples:
+                    out.append(f"{name}{self._fmt(labels)} {v}")
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics()
+metrics.histogram("cropwise_http_request_duration_seconds", "HTTP request latency by route, method and status.")
+metrics.histogram("cropwise_upstream_request_duration_seconds", "OpenWeather call latency by API.")
+metrics.counter("cropwise_upstream_errors_total", "Failed OpenWeather calls by API.")
+metrics.histogram("cropwise_db_session_seconds", "Time a DB connection is checked out of the pool.")
+metrics.histogram("cropwise_password_hash_duration_seconds", "bcrypt hash/verify time by op, queueing included.")
+
+
+def _on_checkout(_dbapi_conn, record, _proxy) -> None:
+    record.info["checkout_at"] = time.perf_counter()
+
+
+def _on_checkin(_dbapi_conn, record) -> None:
+    start = record.info.pop("checkout_at", None)
+    if start is not None:
+        metrics.observe("cropwise_db_session_seconds", (), time.perf_counter() - start)
+
+
+event.listen(engine, "checkout", _on_checkout)
+event.listen(engine, "checkin", _on_checkin)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request.
+
+    The route label is the matched path template (``/admin/crop_rules/{rule_id}``)
+    so cardinality stays bounded; unmatched paths are reported as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            labels = (("method", scope["method"]), ("route", route), ("status", str(status_code[0])))
+            metrics.observe("cropwise_http_request_duration_seconds", labels, time.perf_counter() - start)
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -39,6 +311,9 @@ class User(SQLModel, table=True):
 
 
 class AnalyticsEvent(SQLModel, table=True):
+    # Legacy single-table store, emptied by migration 5; new rows go to AnalyticsStore partitions
+    __table_args__ = (Index("ix_analyticsevent_event_name_created_at", "event_name", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
     event_name: str = Field(index=True)
@@ -46,15 +321,34 @@ class AnalyticsEvent(SQLModel, table=True):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class EventRollup(SQLModel, table=True):
+    # Primary key order serves the summary scans: one period + dimension, a bucket range
+    period: str = Field(primary_key=True)  # "hour", "day" or "month"
+    dim: str = Field(default="", primary_key=True)  # "" (all events), "place" or "season"
+    bucket: datetime = Field(primary_key=True)  # UTC start of the hour/day/month
+    event_name: str = Field(primary_key=True)
+    value: str = Field(default="", primary_key=True)  # the place/season; "" for dim ""
+    count: int = Field(default=0)
+
+
 class PlaceCache(SQLModel, table=True):
+    # Covers the /states keyset scan: ordered by (hits, id), row data read from the index
+    __table_args__ = (Index("ix_placecache_listing", "hits", "id", "name", "lat", "lon"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str = Field(index=True)  # e.g., "Guntur, Andhra Pradesh, IN"
+    name: str = Field(index=True, unique=True)  # e.g., "Guntur, Andhra Pradesh, IN"
     lat: float
     lon: float
     hits: int = Field(default=0)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class PlaceAlias(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    alias: str = Field(index=True, unique=True)  # normalized query, e.g., "guntur"
+    place_id: int = Field(foreign_key="placecache.id", index=True)
+
+
 class CropRule(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
@@ -67,6 +361,20 @@ class CropRule(SQLModel, table=True):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class AppState(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # e.g., "rules_version"
+    value: int = Field(default=0)
+
+
+class StoredForecast(SQLModel, table=True):
+    cell: str = Field(primary_key=True)  # forecast cache grid cell, "lat,lon"
+    fetched_at: float  # epoch seconds
+    tz_offset: int = Field(default=0)  # city.timezone, seconds from UTC
+    dt: bytes  # little-endian int64 column, one per 3-hourly item
+    temp: bytes  # little-endian float32, NaN when missing
+    rain: bytes  # little-endian float32, mm per 3h
+
+
 # ---------------------------
 # Schemas
 # ---------------------------
@@ -95,6 +403,22 @@ class CropRuleIn(BaseModel):
     active: bool = True
 
 
+class BatchLocationIn(BaseModel):
+    place: Optional[str] = None  # geocoded like /live_crops?state=
+    lat: Optional[float] = None  # or explicit coordinates
+    lon: Optional[float] = None
+
+
+class LiveCropsBatchIn(BaseModel):
+    items: List[BatchLocationIn]
+    season: Optional[str] = None  # default: dynamic season per item
+    horizon_h: int = Field(default=FORECAST_DEFAULT_HORIZON, ge=FORECAST_STEP_HOURS, le=FORECAST_MAX_HORIZON)
+
+
+class AdminFlagIn(BaseModel):
+    is_admin: bool
+
+
 class CropRuleOut(BaseModel):
     id: int
     name: str
@@ -107,19 +431,715 @@ class CropRuleOut(BaseModel):
     created_at: datetime
 
 
+# ---------------------------
+# Analytics partitions (one SQLite file per month, gzip NDJSON archives)
+# ---------------------------
+PARTITION_ID_SPAN = 10 ** 10  # partition ids are YYYYMM * span + n, so ids sort across months
+PARTITION_SCHEMA_VERSION = 1  # PRAGMA user_version; 1: JSON meta_json + place/season columns
+
+partition_metadata = MetaData()
+partition_events = Table(
+    "analyticsevent", partition_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=True),
+    Column("event_name", String, nullable=False),
+    Column("meta_json", String, nullable=True),  # JSON object
+    Column("place", String, nullable=True),  # meta["place"], extracted at ingestion
+    Column("season", String, nullable=True),  # meta["season"]
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_analyticsevent_event_name_created_at", "event_name", "created_at"),
+    Index("ix_analyticsevent_place_created_at", "place", "created_at"),
+    Index("ix_analyticsevent_season_created_at", "season", "created_at"),
+    sqlite_autoincrement=True,
+)
+
+
+def month_key(t: datetime) -> int:
+    t = _utc_naive(t)
+    return t.year * 100 + t.month
+
+
+def _months_between(older: int, newer: int) -> int:
+    return (newer // 100 * 12 + newer % 100) - (older // 100 * 12 + older % 100)
+
+
+def normalize_event(rec: dict) -> dict:
+    """Give a pre-JSON event (legacy table, old archive line) JSON meta and place/season keys."""
+    if "place" not in rec:
+        meta = parse_event_meta(rec.get("meta_json"))
+        rec["meta_json"] = json.dumps(meta, separators=(",", ":"), default=str) if meta else None
+        rec["place"], rec["season"] = event_dims(meta)
+    return rec
+
+
+def _upgrade_partition(eng: Engine) -> None:
+    """Bring a partition file to PARTITION_SCHEMA_VERSION; idempotent, batched by id."""
+    with eng.begin() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() >= PARTITION_SCHEMA_VERSION:
+            return
+        columns = {r[1] for r in conn.exec_driver_sql("PRAGMA table_info(analyticsevent)")}
+        for name in ("place", "season"):
+            if name not in columns:
+                conn.exec_driver_sql(f"ALTER TABLE analyticsevent ADD COLUMN {name} VARCHAR")
+        for index in partition_events.indexes:
+            index.create(conn, checkfirst=True)
+        # Before version 1, meta_json held a Python repr: rewrite as JSON and extract the columns
+        c = partition_events.c
+        stmt = (update(partition_events).where(c.id == bindparam("rid"))
+                .values(meta_json=bindparam("meta"), place=bindparam("p"), season=bindparam("s")))
+        last = 0
+        while True:
+            rows = conn.execute(
+                select(c.id, c.meta_json).where(c.id > last, c.meta_json.isnot(None)).order_by(c.id).limit(10000)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for rid, meta_json in rows:
+                rec = normalize_event({"meta_json": meta_json})
+                params.append({"rid": rid, "meta": rec["meta_json"], "p": rec["place"], "s": rec["season"]})
+            conn.execute(stmt, params)
+            last = rows[-1].id
+        conn.exec_driver_sql(f"PRAGMA user_version = {PARTITION_SCHEMA_VERSION}")
+
+
+def event_record(row) -> dict:
+    """A partition or AnalyticsEvent row as a JSON-ready dict (the archive line format)."""
+    rec = dict(row._mapping) if hasattr(row, "_mapping") else dict(row)
+    rec["created_at"] = rec["created_at"].isoformat()
+    return rec
+
+
+class AnalyticsStore:
+    """Raw analytics events in monthly partitions under one directory.
+
+    Recent months (``hot_months``, the current one included) are SQLite
+    files, events_YYYYMM.db, with their own WAL and page cache, so event
+    writes stay out of the main database. Older months are archived to
+    events_YYYYMM.ndjson.gz and the SQLite file removed; months beyond
+    ``retention_months`` are deleted, one file each. iter_events() reads
+    every tier, plus rows left in the legacy AnalyticsEvent table, in id order.
+
+    Every worker runs maintenance, so partition setup and maintain() hold a
+    file lock on the directory (see locked()).
+    """
+
+    def __init__(self, directory: str, hot_months: int, retention_months: int):
+        self.directory = directory
+        self.hot_months = max(1, hot_months)
+        self.retention_months = retention_months
+        self._engines: Dict[int, Engine] = {}
+        self._lock = threading.Lock()
+        self._dir_lock = threading.RLock()
+        self._dir_lock_file = None
+        self._dir_lock_depth = 0
+        self.archived = 0
+        self.dropped = 0
+
+    def _path(self, month: int, ext: str) -> str:
+        return os.path.join(self.directory, f"events_{month}.{ext}")
+
+    @contextmanager
+    def locked(self):
+        """Cross-process lock on the partition directory; re-entrant within this process.
+
+        Take it before ``_lock``, never inside it.
+        """
+        with self._dir_lock:
+            if self._dir_lock_depth == 0 and fcntl is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._dir_lock_file = open(os.path.join(self.directory, ".maintain.lock"), "a")
+                fcntl.flock(self._dir_lock_file, fcntl.LOCK_EX)
+            self._dir_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._dir_lock_depth -= 1
+                if self._dir_lock_depth == 0 and self._dir_lock_file is not None:
+                    fcntl.flock(self._dir_lock_file, fcntl.LOCK_UN)
+                    self._dir_lock_file.close()
+                    self._dir_lock_file = None
+
+    def engine_for(self, month: int, create: bool = True) -> Optional[Engine]:
+        """Engine for one month's partition; only the write path (``create``) makes the file.
+
+        Reads and archival open an existing file only (SQLite ``mode=rw``), so
+        a partition archived by another worker is never recreated empty.
+        Returns None when there is no file, and raises if setup fails; a
+        failed engine is not cached.
+        """
+        with self._lock:
+            eng = self._engines.get(month)
+        if eng is not None:
+            return eng
+        path = self._path(month, "db")
+        with self.locked(), self._lock:
+            eng = self._engines.get(month)
+            if eng is not None:
+                return eng
+            if not create and not os.path.exists(path):
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            eng = make_engine(f"sqlite:///{path}" if create else f"sqlite:///file:{path}?mode=rw&uri=true")
+            try:
+                partition_metadata.create_all(eng)
+                _upgrade_partition(eng)
+                with eng.begin() as conn:
+                    # Start AUTOINCREMENT at this month's id base (no-op once seeded)
+                    conn.exec_driver_sql(
+                        "INSERT INTO sqlite_sequence (name, seq) SELECT 'analyticsevent', ? "
+                        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'analyticsevent')",
+                        (month * PARTITION_ID_SPAN,),
+                    )
+            except Exception:
+                eng.dispose()
+                raise
+            self._engines[month] = eng
+            return eng
+
+    def months(self) -> Dict[int, str]:
+        """month -> "db" or "ndjson.gz"; an archive wins over a SQLite file not yet removed."""
+        found: Dict[int, str] = {}
+        if not os.path.isdir(self.directory):
+            return found
+        for name in os.listdir(self.directory):
+            m = re.fullmatch(r"events_(\d{6})\.(db|ndjson\.gz)", name)
+            if m and found.get(int(m.group(1))) != "ndjson.gz":
+                found[int(m.group(1))] = m.group(2)
+        return dict(sorted(found.items()))
+
+    def _remove(self, month: int, *exts: str) -> None:
+        with self._lock:
+            eng = self._engines.pop(month, None)
+        if eng is not None:
+            eng.dispose()
+        for ext in exts:
+            try:
+                os.remove(self._path(month, ext))
+            except FileNotFoundError:
+                pass
+
+    def archive(self, month: int) -> None:
+        """Write a month to gzip NDJSON (via a temp file + rename), then drop its SQLite file."""
+        eng = self.engine_for(month, create=False)
+        if eng is None:
+            return
+        target = self._path(month, "ndjson.gz")
+        tmp = f"{target}.{os.getpid()}.tmp"
+        stmt = select(partition_events).order_by(partition_events.c.id)
+        with gzip.open(tmp, "wt", encoding="utf-8") as out, eng.connect() as conn:
+            for row in conn.execution_options(yield_per=10000).execute(stmt):
+                out.write(json.dumps(event_record(row), separators=(",", ":")) + "\n")
+        os.replace(tmp, target)
+        self._remove(month, "db", "db-wal", "db-shm")
+        self.archived += 1
+
+    def maintain(self, now: Optional[datetime] = None) -> None:
+        """Apply retention (delete) and archival to every month on disk, one worker at a time."""
+        current = month_key(now or datetime.now(timezone.utc))
+        with self.locked():
+            on_disk = self.months()
+            with self._lock:
+                gone = [m for m in self._engines if on_disk.get(m) != "db"]
+            for month in gone:
+                self._remove(month)  # archived or dropped by another worker
+            for month, tier in on_disk.items():
+                age = _months_between(month, current)
+                if self.retention_months and age >= self.retention_months:
+                    self._remove(month, "db", "db-wal", "db-shm", "ndjson.gz")
+                    self.dropped += 1
+                elif tier == "db" and age >= self.hot_months:
+                    self.archive(month)
+
+    def write(self, month: int, rows: List[dict], batch_size: int) -> None:
+        with self.engine_for(month).begin() as conn:
+            for i in range(0, len(rows), batch_size):
+                conn.execute(partition_events.insert(), rows[i:i + batch_size])
+
+    def iter_events(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    after_id: int = 0, event_name: Optional[str] = None, place: Optional[str] = None,
+                    season: Optional[str] = None, legacy_conn=None):
+        """Event dicts (created_at as naive UTC datetime) in id order, streamed from every tier.
+
+        On the SQLite partitions every filter is a WHERE on an indexed
+        column; legacy rows and archive lines are filtered as they are read.
+        """
+        since, until = (_utc_naive(since) if since else None), (_utc_naive(until) if until else None)
+        wanted = {k: v for k, v in (("event_name", event_name), ("place", place), ("season", season)) if v}
+        c = partition_events.c
+
+        def where(stmt, cols, indexed: bool = False):
+            stmt = stmt.where(cols.id > after_id)
+            if since:
+                stmt = stmt.where(cols.created_at >= since)
+            if until:
+                stmt = stmt.where(cols.created_at < until)
+            if indexed:
+                for key, value in wanted.items():
+                    stmt = stmt.where(cols[key] == value)
+            return stmt.order_by(cols.id)
+
+        def matches(rec: dict) -> bool:
+            return all(rec.get(key) == value for key, value in wanted.items())
+
+        legacy = AnalyticsEvent.__table__
+        if after_id < PARTITION_ID_SPAN:
+            stmt = where(select(legacy), legacy.c)
+            with (engine.connect() if legacy_conn is None else nullcontext(legacy_conn)) as conn:
+                for r in conn.execution_options(yield_per=10000).execute(stmt):
+                    rec = normalize_event(dict(r._mapping))
+                    if matches(rec):
+                        yield rec
+
+        for month, tier in self.months().items():
+            if (since and month < month_key(since)) or (until and month > month_key(until)) \
+                    or month < after_id // PARTITION_ID_SPAN:
+                continue
+            if tier == "ndjson.gz":
+                with gzip.open(self._path(month, tier), "rt", encoding="utf-8") as f:
+                    for line in f:
+                        rec = normalize_event(json.loads(line))
+                        rec["created_at"] = datetime.fromisoformat(rec["created_at"])
+                        if rec["id"] > after_id and (not since or rec["created_at"] >= since) \
+                                and (not until or rec["created_at"] < until) and matches(rec):
+                            yield rec
+                continue
+            eng = self.engine_for(month, create=False)
+            if eng is None:
+                continue  # archived meanwhile
+            with eng.connect() as conn:
+                for r in conn.execution_options(yield_per=10000).execute(where(select(partition_events), c, True)):
+                    yield dict(r._mapping)
+
+    def stats(self) -> dict:
+        months = self.months()
+        return {
+            "hot": [m for m, tier in months.items() if tier == "db"],
+            "archived": [m for m, tier in months.items() if tier != "db"],
+            "archived_runs": self.archived,
+            "dropped": self.dropped,
+        }
+
+
+analytics_store = AnalyticsStore(ANALYTICS_DIR, ANALYTICS_HOT_MONTHS, ANALYTICS_RETENTION_MONTHS)
+
+
+# ---------------------------
+# Write-behind buffers (place hits, analytics events)
+# ---------------------------
+class PeriodicFlusher(abc.ABC):
+    """Base for in-memory buffers drained by a background thread.
+
+    The thread calls ``flush()`` every ``interval`` seconds, or sooner when
+    ``_wake`` is set; ``stop()`` performs a final flush on shutdown.
+    """
+
+    name = "flusher"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @abc.abstractmethod
+    def flush(self) -> int:
+        """Drain the buffer; returns the number of items written."""
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+        self.flush()
+
+
+class HitCounter(PeriodicFlusher):
+    """Accumulates PlaceCache hit increments in memory.
+
+    Increments are applied as one batched UPDATE per flush, so cache hits
+    never open a write transaction themselves. /states ordering is
+    eventually consistent with the true counts.
+    """
+
+    name = "place-hits-flusher"
+
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self._pending: Dict[int, int] = {}
+
+    def incr(self, place_id: int, n: int = 1) -> None:
+        with self._lock:
+            self._pending[place_id] = self._pending.get(place_id, 0) + n
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        stmt = (
+            update(PlaceCache.__table__)
+            .where(PlaceCache.__table__.c.id == bindparam("pid"))
+            .values(hits=PlaceCache.__table__.c.hits + bindparam("n"))
+        )
+        try:
+            with engine.begin() as conn:
+                conn.execute(stmt, [{"pid": pid, "n": n} for pid, n in pending.items()])
+        except Exception:
+            # Keep the increments for the next attempt rather than losing them
+            with self._lock:
+                for pid, n in pending.items():
+                    self._pending[pid] = self._pending.get(pid, 0) + n
+            raise
+        return len(pending)
+
+
+ROLLUP_PERIODS: Tuple[Tuple[str, Callable[[datetime], datetime]], ...] = (
+    ("hour", lambda t: t.replace(minute=0, second=0, microsecond=0)),
+    ("day", lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0)),
+    ("month", lambda t: t.replace(day=1, hour=0, minute=0, second=0, microsecond=0)),
+)
+ROLLUP_KEY = ("period", "dim", "bucket", "event_name", "value")
+
+
+def _utc_naive(t: datetime) -> datetime:
+    return t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t
+
+
+def parse_event_meta(text: Optional[str]) -> dict:
+    """meta_json as a dict; older rows hold a Python repr rather than JSON."""
+    if not text:
+        return {}
+    try:
+        meta = json.loads(text)
+    except ValueError:
+        try:
+            meta = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def event_dims(meta: Optional[dict]) -> Tuple[Optional[str], Optional[str]]:
+    """(place, season) from event metadata, trimmed; None when absent."""
+    meta = meta or {}
+    dims = []
+    for key in ("place", "season"):
+        value = meta.get(key)
+        value = str(value).strip()[:ANALYTICS_META_MAX_LEN] if isinstance(value, (str, int, float)) else ""
+        dims.append(value or None)
+    return dims[0], dims[1]
+
+
+def rollup_counts(rows, counts: Optional[Dict[tuple, int]] = None) -> Dict[tuple, int]:
+    """Add event rows ({event_name, created_at, place, season}) to per-bucket counts keyed by ROLLUP_KEY."""
+    counts = {} if counts is None else counts
+    for row in rows:
+        created_at = _utc_naive(row["created_at"])
+        dims = [("", "")]
+        if row.get("place"):
+            dims.append(("place", row["place"]))
+        if row.get("season"):
+            dims.append(("season", row["season"]))
+        for period, truncate in ROLLUP_PERIODS:
+            bucket = truncate(created_at)
+            for dim, value in dims:
+                key = (period, dim, bucket, row["event_name"], value)
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def upsert_rollups(conn, counts: Dict[tuple, int]) -> None:
+    """Add counts to EventRollup in one executemany upsert (SQLite or PostgreSQL)."""
+    if not counts:
+        return
+    table = EventRollup.__table__
+    stmt = (pg_insert if conn.dialect.name == "postgresql" else sqlite_insert)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY), set_={"count": table.c.count + stmt.excluded["count"]},
+    )
+    conn.execute(stmt, [dict(zip(ROLLUP_KEY, key), count=n) for key, n in counts.items()])
+
+
+class EventBuffer(PeriodicFlusher):
+    """Queues analytics events and writes them with multi-row INSERTs.
+
+    Rows go to their month's AnalyticsStore partition; the EventRollup
+    counts for the rows written are then upserted in the main database.
+    A flush happens every ``interval`` seconds or as soon as
+    ``batch_size`` rows are queued. Beyond ``max_pending`` rows new events are dropped
+    (and counted) rather than growing memory without bound.
+    """
+
+    name = "analytics-flusher"
+
+    def __init__(self, interval: float, batch_size: int, max_pending: int):
+        super().__init__(interval)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._rows: List[dict] = []
+        self._counts: Dict[tuple, int] = {}  # rollups of stored events not yet upserted
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, rows: List[dict]) -> int:
+        with self._lock:
+            room = max(0, self.max_pending - len(self._rows))
+            accepted = rows[:room]
+            self.dropped += len(rows) - len(accepted)
+            self._rows.extend(accepted)
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self._wake.set()
+        return len(accepted)
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._rows = self._rows, []
+            counts, self._counts = self._counts, {}
+        if not rows and not counts:
+            return 0
+        by_month: Dict[int, List[dict]] = {}
+        for row in rows:
+            by_month.setdefault(month_key(row["created_at"]), []).append(row)
+        months = sorted(by_month)
+        done = 0
+        try:
+            for month in months:
+                analytics_store.write(month, by_month[month], self.batch_size)
+                done += 1
+        except Exception:
+            failed = [r for m in months[done:] for r in by_month[m]]
+            with self._lock:
+                self._rows[:0] = failed
+                overflow = len(self._rows) - self.max_pending
+                if overflow > 0:
+                    del self._rows[self.max_pending:]
+                    self.dropped += overflow
+            raise
+        finally:
+            written = [r for m in months[:done] for r in by_month[m]]
+            self.written += len(written)
+            rollup_counts(written, counts)
+            self._upsert_rollups(counts)
+        return len(rows)
+
+    def _upsert_rollups(self, counts: Dict[tuple, int]) -> None:
+        if not counts:
+            return
+        try:
+            with engine.begin() as conn:
+                upsert_rollups(conn, counts)
+        except Exception:
+            # The events are already stored in their partition: keep their counts for the next flush
+            with self._lock:
+                for key, n in counts.items():
+                    self._counts[key] = self._counts.get(key, 0) + n
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": len(self._rows), "rollups_pending": len(self._counts),
+                    "written": self.written, "dropped": self.dropped}
+
+
+class AnalyticsJanitor(PeriodicFlusher):
+    """Runs AnalyticsStore.maintain() (retention + archival) every ``interval`` seconds."""
+
+    name = "analytics-janitor"
+
+    def flush(self) -> int:
+        analytics_store.maintain()
+        return 0
+
+
+place_hits = HitCounter(interval=PLACE_HITS_FLUSH_INTERVAL)
+event_buffer = EventBuffer(
+    interval=ANALYTICS_FLUSH_INTERVAL,
+    batch_size=ANALYTICS_BATCH_SIZE,
+    max_pending=ANALYTICS_MAX_PENDING,
+)
+analytics_janitor = AnalyticsJanitor(interval=ANALYTICS_MAINTENANCE_INTERVAL)
+
+
 # ---------------------------
 # Startup & Auth helpers
 # ---------------------------
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+SCHEMA_VERSION_KEY = "schema_version"
 
 
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+def read_app_state(session: Session, key: str) -> int:
+    row = session.get(AppState, key)
+    return row.value if row else 0
+
+
+def bump_app_state(session: Session, key: str) -> None:
+    """Increment a version stamp; call inside the transaction that makes the change."""
+    row = session.get(AppState, key)
+    if row is None:
+        row = AppState(key=key, value=0)
+    row.value += 1
+    session.add(row)
+
+
+def _create_index(index: Index) -> Callable[[Any], None]:
+    return lambda conn: index.create(conn, checkfirst=True)
+
+
+def _table_index(model, name: str) -> Index:
+    return next(ix for ix in model.__table__.indexes if ix.name == name)
+
+
+def _sql(*statements: str) -> Callable[[Any], None]:
+    def step(conn) -> None:
+        for stmt in statements:
+            conn.exec_driver_sql(stmt)
+    return step
+
+
+def _merge_duplicate_places(conn) -> None:
+    """Fold PlaceCache rows sharing a name into the oldest one, then make name unique; safe to re-run.
+
+    Databases created before name was unique can hold duplicates, and
+    create_all() never adds the constraint to an existing table.
+    """
+    places, aliases = PlaceCache.__table__, PlaceAlias.__table__
+    dup_names = select(places.c.name).group_by(places.c.name).having(func.count() > 1)
+    for (name,) in conn.execute(dup_names).all():
+        rows = conn.execute(select(places.c.id, places.c.hits).where(places.c.name == name).order_by(places.c.id)).all()
+        keep, extra = rows[0].id, [r.id for r in rows[1:]]
+        conn.execute(update(places).where(places.c.id == keep).values(hits=sum(r.hits for r in rows)))
+        conn.execute(update(aliases).where(aliases.c.place_id.in_(extra)).values(place_id=keep))
+        conn.execute(places.delete().where(places.c.id.in_(extra)))
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_placecache_name")
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_placecache_name ON placecache (name)")
+
+
+def _rebuild_rollups(conn) -> None:
+    """Recompute EventRollup from every stored event (archives included); safe to re-run."""
+    conn.execute(EventRollup.__table__.delete())
+    counts: Dict[tuple, int] = {}
+    for ev in analytics_store.iter_events(legacy_conn=conn):
+        rollup_counts([ev], counts)
+    upsert_rollups(conn, counts)
+
+
+def _partition_legacy_events(conn) -> None:
+    """Move AnalyticsEvent rows into monthly partitions (id -> month base + id); safe to re-run."""
+    table = AnalyticsEvent.__table__
+    pending: Dict[int, List[dict]] = {}
+
+    def write_pending() -> None:
+        for month, recs in pending.items():
+            with analytics_store.engine_for(month).begin() as pconn:
+                pconn.execute(sqlite_insert(partition_events).on_conflict_do_nothing(), recs)
+        pending.clear()
+
+    stmt = select(table).order_by(table.c.id)
+    for n, row in enumerate(conn.execution_options(yield_per=10000).execute(stmt), 1):
+        rec = normalize_event(dict(row._mapping))
+        month = month_key(rec["created_at"])
+        rec["id"] += month * PARTITION_ID_SPAN
+        pending.setdefault(month, []).append(rec)
+        if n % 10000 == 0:
+            write_pending()
+    write_pending()
+    conn.execute(table.delete())
+
+
+# Ordered, append-only. Each step must be idempotent: several workers may
+# start at once, and create_all() already covers fresh databases.
+MIGRATIONS: List[Tuple[int, str, Callable[[Any], None]]] = [
+    (1, "analytics (event_name, created_at) index",
+     _create_index(_table_index(AnalyticsEvent, "ix_analyticsevent_event_name_created_at"))),
+    (2, "placecache (hits, id) index",
+     _sql("CREATE INDEX IF NOT EXISTS ix_placecache_hits_id ON placecache (hits, id)")),
+    (3, "placecache covering listing index replaces (hits, id)",
+     _sql("DROP INDEX IF EXISTS ix_placecache_hits_id",
+          "CREATE INDEX IF NOT EXISTS ix_placecache_listing ON placecache (hits, id, name, lat, lon)")),
+    (4, "backfill analytics rollups", _rebuild_rollups),
+    (5, "move analytics events to monthly partitions", _partition_legacy_events),
+    (6, "merge duplicate places, unique placecache.name", _merge_duplicate_places),
+]
+
+
+MIGRATION_LOCK_ID = 0x43_57_4D_47  # pg_advisory_lock key ("CWMG")
+
+
+@contextmanager
+def migration_lock():
+    """Hold a cross-process lock: a file lock next to a SQLite database, an advisory lock on PostgreSQL."""
+    if DATABASE_URL.startswith("sqlite:///") and fcntl is not None:
+        with open(DATABASE_URL[len("sqlite:///"):] + ".migrate.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    elif engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_ID})")
+            try:
+                yield
+            finally:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})")
+                conn.commit()
+    else:
+        yield
 
 
-def hash_password(plain: str) -> str:
-    return pwd_context.hash(plain)
+def _schema_version() -> int:
+    with Session(engine) as session:
+        return read_app_state(session, SCHEMA_VERSION_KEY)
+
+
+def run_migrations() -> int:
+    """Apply migrations newer than the recorded schema_version; returns the new version.
+
+    Call under migration_lock() (create_db_and_tables() does).
+    """
+    current = _schema_version()
+    for version, _name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+        with Session(engine) as session:
+            row = session.get(AppState, SCHEMA_VERSION_KEY) or AppState(key=SCHEMA_VERSION_KEY, value=0)
+            row.value = max(row.value, version)
+            session.add(row)
+            session.commit()
+        current = version
+    return current
+
+
+def create_db_and_tables():
+    """Create tables and apply migrations, one process at a time.
+
+    Other workers wait on the lock and then find the schema current.
+    gunicorn.conf.py runs this once before any worker boots, so the long
+    data migrations (4, 5) never run inside a worker's boot timeout.
+    """
+    with migration_lock():
+        SQLModel.metadata.create_all(engine)
+        run_migrations()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -133,86 +1153,630 @@ def get_user_by_username(session: Session, username: str) -> Optional[User]:
     return session.exec(select(User).where(User.username == username)).first()
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+class CurrentUser(NamedTuple):
+    """Identity resolved from a verified bearer token."""
+
+    id: int
+    username: str
+    is_admin: bool
+
+
+def resolve_token(token: str) -> Optional[CurrentUser]:
+    """Verify a JWT and resolve its user, via the token cache.
+
+    Entries live for at most AUTH_CACHE_TTL seconds and never beyond the
+    token's own ``exp``, and are dropped when auth_version moves; invalid
+    tokens and unknown users are not cached.
+    """
+    auth_version.check()
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
     with Session(engine) as session:
         user = get_user_by_username(session, username)
         if user is None:
-            raise credentials_exception
-        return user
+            return None
+        ident = CurrentUser(user.id, user.username, user.is_admin)
+    ttl = AUTH_CACHE_TTL
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    if ttl > 0:
+        auth_cache.set(token, ident, ttl=ttl)
+    return ident
+
+
+def invalidate_user_auth(username: str) -> int:
+    """Forget cached tokens for a user in this worker, e.g. after their admin flag changes."""
+    return auth_cache.discard_if(lambda ident: ident.username == username)
+
+
+AUTH_VERSION_KEY = "auth_version"
+
+
+class AuthVersion:
+    """Clears the token cache when user rights change in any worker.
+
+    Changes bump the ``auth_version`` stamp in their own transaction; each
+    worker reads it at most once per ``check_interval`` seconds (like
+    RuleIndex does ``rules_version``) and drops every cached identity when
+    it has moved, so a demoted admin loses access everywhere within that
+    interval rather than AUTH_CACHE_TTL.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.version: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            with Session(engine) as session:
+                version = read_app_state(session, AUTH_VERSION_KEY)
+            if self.version is not None and version != self.version:
+                auth_cache.clear()
+            self.version = version
+            self._checked_at = time.monotonic()
 
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
+auth_version = AuthVersion(check_interval=AUTH_VERSION_CHECK_INTERVAL)
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    user = resolve_token(token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+def require_admin(user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
 
+# ---------------------------
+# Password hashing (bounded process pool)
+# ---------------------------
+class PasswordHasher:
+    """Runs bcrypt in a dedicated process pool with a bounded queue.
+
+    At most ``max_pending`` operations may be running or queued; beyond that
+    callers get 503 with Retry-After straight away instead of waiting, so a
+    login burst cannot tie up the threadpool the data routes depend on.
+
+    Workers are spawned rather than forked, so they do not inherit the
+    server's signal handlers and exit on SIGTERM; they run the functions in
+    passwords.py and never import this module. A pool broken by a dead
+    worker (e.g. OOM-killed) is replaced on the next call. Timings are
+    exported as cropwise_password_hash_duration_seconds.
+    """
+
+    def __init__(self, workers: int, max_pending: int, retry_after: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=passwords.init_worker,
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn in the pool, retrying once on a fresh pool if the current one is broken."""
+        for attempt in range(2):
+            executor = self._pool()
+            try:
+                return await asyncio.wrap_future(executor.submit(fn, *args))
+            except BrokenProcessPool:
+                self._discard(executor)
+                if attempt:
+                    raise
+
+    def _record(self, op: str, key: str, seconds: float = 0.0) -> None:
+        t = self._timings.setdefault(op, {"count": 0, "rejected": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+        t[key] += 1
+        if key == "count":
+            t["total_s"] += seconds
+            t["max_s"] = max(t["max_s"], seconds)
+
+    async def _run(self, op: str, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._record(op, "rejected")
+                raise HTTPException(
+                    503,
+                    "Authentication is busy, please retry shortly",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            result = await self._submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._record(op, "errors")
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._record(op, "count", elapsed)
+            metrics.observe("cropwise_password_hash_duration_seconds", (("op", op),), elapsed)
+            return result
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, plain: str) -> str:
+        return await self._run("hash", passwords.hash_password, plain)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run("verify", passwords.verify_password, plain, hashed)
+
+    def shutdown(self) -> None:
+        """Cancel queued work and wait for the workers to exit."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            ops = {}
+            for op, t in self._timings.items():
+                ops[op] = dict(t, avg_s=round(t["total_s"] / t["count"], 4) if t["count"] else None)
+            return {"workers": self.workers, "max_pending": self.max_pending, "pending": self._pending, "ops": ops}
+
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    retry_after=PASSWORD_HASH_RETRY_AFTER,
+)
+
+
 # ---------------------------
 # External API helpers
 # ---------------------------
-def _get_json(url: str, timeout: int = 20) -> dict:
-    """Requests wrapper with timeouts and clear error surfacing."""
-    try:
-        r = requests.get(url, timeout=timeout)
-    except requests.RequestException as e:
-        raise HTTPException(502, f"Upstream request failed: {e}")
-    if r.status_code != 200:
-        # Bubble up any upstream message (OpenWeather sends JSON or text)
-        raise HTTPException(502, f"Upstream error {r.status_code}: {r.text}")
-    try:
-        return r.json()
-    except ValueError:
-        raise HTTPException(502, "Upstream returned non-JSON response")
+class UpstreamClient:
+    """Shared, pooled HTTP client for upstream APIs.
+
+    Keeps one ``httpx.AsyncClient`` per host (keep-alive, bounded pool) so
+    endpoints can await upstream calls without holding a threadpool worker.
+    """
+
+    def __init__(self, connect_timeout: float, read_timeout: float, max_per_host: int):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_per_host = max_per_host
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _async_client(self, url: str) -> httpx.AsyncClient:
+        host = httpx.URL(url).host
+        client = self._async_clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_per_host, max_keepalive_connections=self.max_per_host),
+            )
+            self._async_clients[host] = client
+        return client
+
+    @staticmethod
+    def _decode(status_code: int, text: str, parse: Callable[[], Any]) -> Any:
+        if status_code != 200:
+            # Bubble up any upstream message (OpenWeather sends JSON or text)
+            raise HTTPException(502, f"Upstream error {status_code}: {text}")
+        try:
+            return parse()
+        except ValueError:
+            raise HTTPException(502, "Upstream returned non-JSON response")
+
+    @staticmethod
+    def _observe(api: str, start: float, ok: bool) -> None:
+        labels = (("api", api),)
+        metrics.observe("cropwise_upstream_request_duration_seconds", labels, time.perf_counter() - start)
+        if not ok:
+            metrics.inc("cropwise_upstream_errors_total", labels)
+
+    async def aget_json(self, url: str, api: str = "other") -> Any:
+        start, ok = time.perf_counter(), False
+        try:
+            r = await self._async_client(url).get(url)
+            result = self._decode(r.status_code, r.text, r.json)
+            ok = True
+            return result
+        except httpx.HTTPError as e:
+            raise HTTPException(502, f"Upstream request failed: {e}")
+        finally:
+            self._observe(api, start, ok)
+
+    async def aclose(self) -> None:
+        clients, self._async_clients = self._async_clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+upstream = UpstreamClient(
+    connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+    read_timeout=UPSTREAM_READ_TIMEOUT,
+    max_per_host=UPSTREAM_MAX_PER_HOST,
+)
+
 
+async def _aget_json(url: str, api: str = "other") -> dict:
+    """Pooled GET with timeouts and clear error surfacing."""
+    return await upstream.aget_json(url, api)
 
-def ow_geocode(query: str, limit: int = 5) -> List[dict]:
+
+def _geocode_url(query: str, limit: int) -> str:
     if not OPENWEATHER_API_KEY:
         raise HTTPException(500, "OPENWEATHER_API_KEY not set on server")
     # Bias to India if user didn't specify a country already
     q = query.strip()
     if ",IN" not in q.upper() and ", INDIA" not in q.upper():
         q = f"{q}, IN"
-    url = (
-        "http://api.openweathermap.org/geo/1.0/direct"
-        f"?q={quote(q)}&limit={limit}&appid={OPENWEATHER_API_KEY}"
-    )
-    return _get_json(url)
+    return f"{OPENWEATHER_BASE_URL}/geo/1.0/direct?q={quote(q)}&limit={limit}&appid={OPENWEATHER_API_KEY}"
 
 
-def ow_forecast(lat: float, lon: float) -> dict:
+def _forecast_url(lat: float, lon: float) -> str:
     if not OPENWEATHER_API_KEY:
         raise HTTPException(500, "OPENWEATHER_API_KEY not set on server")
-    url = (
-        "https://api.openweathermap.org/data/2.5/forecast"
-        f"?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-    )
-    return _get_json(url)
+    return f"{OPENWEATHER_BASE_URL}/data/2.5/forecast?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
+
+
+async def ow_geocode_async(query: str, limit: int = 5) -> List[dict]:
+    return await _aget_json(_geocode_url(query, limit), "geocode")
+
+
+async def ow_forecast_async(lat: float, lon: float) -> dict:
+    return await _aget_json(_forecast_url(lat, lon), "forecast")
+
+
+# ---------------------------
+# Forecast series (compact columns + prefix sums)
+# ---------------------------
+_DT_DTYPE = np.dtype("<i8")
+_VALUE_DTYPE = np.dtype("<f4")
+
+
+class ForecastSeries:
+    """One 3-hourly forecast as numpy columns with prefix sums.
+
+    Temperature and rain are kept as float32 and read back rounded to 0.01,
+    which is all OpenWeather reports, so no value changes on the way through.
+    The sums run in float64, so any window or day bucket costs two array
+    lookups. A window sum of 0.01-step values is itself a 0.01-step value, so
+    it is rounded back to 2 decimals: subtracting two prefix sums otherwise
+    leaks float noise (3.799999999999999) into the response.
+    """
+
+    def __init__(self, dt, temp, rain, tz_offset: int = 0, fetched_at: Optional[float] = None):
+        self.dt = np.asarray(dt, dtype=_DT_DTYPE)
+        self.temp = np.asarray(temp, dtype=_VALUE_DTYPE)
+        self.rain = np.asarray(rain, dtype=_VALUE_DTYPE)
+        self.tz_offset = int(tz_offset)
+        self.fetched_at = time.time() if fetched_at is None else float(fetched_at)
+        temps = np.round(self.temp.astype(np.float64), 2)
+        valid = ~np.isnan(temps)
+        # Leading zero, so the window [i, j) is s[j] - s[i]
+        self._temp_sum = np.concatenate(([0.0], np.cumsum(np.where(valid, temps, 0.0))))
+        self._temp_n = np.concatenate(([0], np.cumsum(valid)))
+        self._rain_sum = np.concatenate(([0.0], np.cumsum(np.round(self.rain.astype(np.float64), 2))))
+
+    @classmethod
+    def from_forecast(cls, forecast_json: dict, fetched_at: Optional[float] = None) -> "ForecastSeries":
+        items = forecast_json.get("list") or []
+        dt, temp, rain = [], [], []
+        for x in items:
+            t = x.get("main", {}).get("temp")
+            r3 = x.get("rain", {}).get("3h")
+            dt.append(int(x.get("dt") or 0))
+            temp.append(t if isinstance(t, (int, float)) else np.nan)
+            rain.append(r3 if isinstance(r3, (int, float)) else 0.0)
+        tz_offset = (forecast_json.get("city") or {}).get("timezone") or 0
+        return cls(dt, temp, rain, tz_offset, fetched_at)
+
+    @classmethod
+    def from_row(cls, row: "StoredForecast") -> "ForecastSeries":
+        return cls(
+            np.frombuffer(row.dt, dtype=_DT_DTYPE),
+            np.frombuffer(row.temp, dtype=_VALUE_DTYPE),
+            np.frombuffer(row.rain, dtype=_VALUE_DTYPE),
+            row.tz_offset,
+            row.fetched_at,
+        )
+
+    def to_row(self, cell: str) -> "StoredForecast":
+        return StoredForecast(
+            cell=cell, fetched_at=self.fetched_at, tz_offset=self.tz_offset,
+            dt=self.dt.tobytes(), temp=self.temp.tobytes(), rain=self.rain.tobytes(),
+        )
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    @property
+    def first_dt(self) -> Optional[int]:
+        return int(self.dt[0]) if len(self.dt) else None
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def _summarize(self, i: int, j: int) -> dict:
+        if j <= i:
+            return {"avg_temp_c": None, "total_rain_mm": None}
+        n = int(self._temp_n[j] - self._temp_n[i])
+        avg_temp = round(float(self._temp_sum[j] - self._temp_sum[i]), 2) / n if n else None
+        return {"avg_temp_c": avg_temp, "total_rain_mm": round(float(self._rain_sum[j] - self._rain_sum[i]), 2)}
+
+    def summary(self, hours: int = FORECAST_DEFAULT_HORIZON) -> dict:
+        """Average temperature and total rain over the first `hours` of the series."""
+        return self._summarize(0, min(len(self.dt), max(0, hours // FORECAST_STEP_HOURS)))
+
+    def daily(self) -> List[dict]:
+        """Per local calendar day buckets; the first and last days may be partial."""
+        if not len(self.dt):
+            return []
+        days = (self.dt + self.tz_offset) // 86400
+        bounds = [0, *(np.flatnonzero(np.diff(days)) + 1).tolist(), len(days)]
+        buckets = []
+        for i, j in zip(bounds, bounds[1:]):
+            day = datetime.fromtimestamp(int(days[i]) * 86400, timezone.utc).date()
+            buckets.append({"date": day.isoformat(), "hours": (j - i) * FORECAST_STEP_HOURS, **self._summarize(i, j)})
+        return buckets
+
+
+# ---------------------------
+# Forecast cache (TTL + LRU, single-flight)
+# ---------------------------
+class _Flight:
+    """One in-progress load that concurrent misses for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry.
+
+    Concurrent misses for one key collapse into a single call to the loader;
+    the other callers block until it finishes and share its result (or error).
+    Sync and async callers coalesce separately (threads vs. event-loop futures).
+    """
+
+    def __init__(self, ttl: float, maxsize: int, ttl_for: Optional[Callable[[Any], float]] = None):
+        self.ttl = ttl
+        self.ttl_for = ttl_for  # per-value TTL for set() calls that don't pass one
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._ainflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _get_locked(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """Seconds until the entry expires (None if absent); no stats, no LRU bump."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] - time.monotonic()
+            return remaining if remaining > 0 else None
+
+    def peek(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry[1] if entry and entry[0] > time.monotonic() else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl if self.ttl_for is None else self.ttl_for(value)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            self.set(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    async def aget_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            fut = self._ainflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._ainflight[key] = asyncio.get_running_loop().create_future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # shield: a cancelled waiter must not cancel the shared load
+            return await asyncio.shield(fut)
+
+        try:
+            value = await loader()
+            self.set(key, value)
+            fut.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            with self._lock:
+                self._ainflight.pop(key, None)
+
+    def discard_if(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop every entry whose value matches; O(n), meant for rare invalidations."""
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(v)]
+            for k in doomed:
+                del self._data[k]
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# cell -> ForecastSeries; entries loaded from the DB keep only the TTL they have left
+forecast_cache = TTLCache(
+    ttl=FORECAST_CACHE_TTL, maxsize=FORECAST_CACHE_SIZE, ttl_for=lambda s: FORECAST_CACHE_TTL - s.age(),
+)
+auth_cache = TTLCache(ttl=AUTH_CACHE_TTL, maxsize=AUTH_CACHE_SIZE)  # token -> CurrentUser
+# (id(series), season, horizon, month, rules version) -> (series, result); see live_recommendation()
+recommendation_cache = TTLCache(ttl=FORECAST_CACHE_TTL, maxsize=FORECAST_CACHE_SIZE * 4)
+
+
+def forecast_cell(lat: float, lon: float) -> tuple:
+    """Round coordinates to the cache grid so nearby lookups share an entry."""
+    return (round(lat, FORECAST_CACHE_PRECISION), round(lon, FORECAST_CACHE_PRECISION))
+
+
+def _cell_key(cell: tuple) -> str:
+    return f"{cell[0]},{cell[1]}"
+
+
+def _stored_series(session: Session, cell: tuple) -> Optional[ForecastSeries]:
+    """The persisted series for a cell, if it is still within the cache TTL."""
+    row = session.get(StoredForecast, _cell_key(cell))
+    if row is None or time.time() - row.fetched_at >= FORECAST_CACHE_TTL:
+        return None
+    return ForecastSeries.from_row(row)
+
+
+def _store_series(session: Session, cell: tuple, series: ForecastSeries) -> None:
+    session.merge(series.to_row(_cell_key(cell)))
+    session.commit()
+
+
+async def fetch_forecast_async(cell: tuple) -> ForecastSeries:
+    """Upstream forecast for a cell, persisted for other workers and restarts."""
+    series = ForecastSeries.from_forecast(await ow_forecast_async(*cell))
+    await run_in_threadpool(_in_session, _store_series, cell, series)
+    return series
 
 
-def forecast_summary(forecast_json: dict) -> dict:
-    items = forecast_json.get("list", [])[:24]  # next ~72h
-    if not items:
-        return {"avg_temp_c": None, "total_rain_mm": None}
-    temps = [x.get("main", {}).get("temp") for x in items]
-    temps = [t for t in temps if isinstance(t, (int, float))]
-    rain = 0.0
-    for x in items:
-        r3 = x.get("rain", {}).get("3h")
-        rain += float(r3) if isinstance(r3, (int, float)) else 0.0
-    avg_temp = sum(temps) / len(temps) if temps else None
-    return {"avg_temp_c": avg_temp, "total_rain_mm": rain}
+async def get_forecast_async(lat: float, lon: float) -> ForecastSeries:
+    """Cached forecast series for the rounded cell: memory, then DB, then upstream."""
+    cell = forecast_cell(lat, lon)
+
+    async def load() -> ForecastSeries:
+        return await run_in_threadpool(_in_session, _stored_series, cell) or await fetch_forecast_async(cell)
+
+    return await forecast_cache.aget_or_load(cell, load)
+
+
+def forecast_summary(forecast_json: dict, hours: int = FORECAST_DEFAULT_HORIZON) -> dict:
+    return ForecastSeries.from_forecast(forecast_json).summary(hours)  # next ~72h by default
 
 
 # ---------------------------
@@ -275,23 +1839,606 @@ def tag_for_score(score: float) -> str:
     return "Low"
 
 
+# ---------------------------
+# Batch scoring (vectorized)
+# ---------------------------
+TAG_LABELS = np.array(["Low", "Moderate", "Good", "Excellent"], dtype=object)
+TAG_CUTOFFS = np.array([40.0, 60.0, 80.0])
+
+
+def rule_thresholds(rules) -> np.ndarray:
+    """(N, 4) float64 array of [temp_min, temp_max, rain_min, rain_max]."""
+    if not rules:
+        return np.empty((0, 4), dtype=np.float64)
+    return np.array([(r.temp_min, r.temp_max, r.rain_min, r.rain_max) for r in rules], dtype=np.float64)
+
+
+def _round2(raw: np.ndarray) -> np.ndarray:
+    """round(x, 2) with Python's exact (decimal) semantics.
+
+    np.round scales by 100 first, which can disagree with builtin round() on
+    values that sit within float error of a .xx5 midpoint; those few cells
+    are re-rounded in Python so results match score_crop() bit for bit.
+    """
+    scaled = raw * 100.0
+    out = np.rint(scaled) / 100.0
+    frac = scaled - np.floor(scaled)
+    ambiguous = np.abs(frac - 0.5) < 1e-6
+    if ambiguous.any():
+        idx = np.nonzero(ambiguous)
+        out[idx] = [round(float(x), 2) for x in raw[idx]]
+    return out
+
+
+def score_matrix(thresholds: np.ndarray, avg_temps, total_rains) -> np.ndarray:
+    """Vectorized score_crop() for N rules x M weather samples.
+
+    ``thresholds`` comes from rule_thresholds(); ``avg_temps`` and
+    ``total_rains`` are length-M sequences where None/NaN means "no data"
+    (scored 0.0, as score_crop() does). Returns an (N, M) float64 array.
+    score_crop() remains the reference implementation.
+    """
+    t = np.asarray(avg_temps, dtype=np.float64).reshape(1, -1)
+    rain = np.asarray(total_rains, dtype=np.float64).reshape(1, -1)
+    tmin, tmax, rmin, rmax = (thresholds[:, i:i + 1] for i in range(4))
+
+    tscore = np.where(
+        t < tmin,
+        np.maximum(0.0, 100 - (tmin - t) * 8),
+        np.where(t > tmax, np.maximum(0.0, 100 - (t - tmax) * 8), 100.0),
+    )
+    rscore = np.where(
+        rain < rmin,
+        np.maximum(0.0, 100 - (rmin - rain) * 2),
+        np.where(rain > rmax, np.maximum(0.0, 100 - (rain - rmax) * 1.2), 100.0),
+    )
+    scores = _round2(tscore * 0.6 + rscore * 0.4)
+    missing = np.isnan(t) | np.isnan(rain)
+    return np.where(missing, 0.0, scores)
+
+
+def tags_for_scores(scores: np.ndarray) -> np.ndarray:
+    """Vectorized tag_for_score(); returns an object array of labels."""
+    return TAG_LABELS[np.searchsorted(TAG_CUTOFFS, scores, side="right")]
+
+
+def score_batch(rules, avg_temps, total_rains) -> Tuple[np.ndarray, np.ndarray]:
+    """Score every rule against every weather sample; returns (scores, tags)."""
+    thresholds = rules if isinstance(rules, np.ndarray) else rule_thresholds(rules)
+    avg_temps = [np.nan if x is None else x for x in avg_temps]
+    total_rains = [np.nan if x is None else x for x in total_rains]
+    scores = score_matrix(thresholds, avg_temps, total_rains)
+    return scores, tags_for_scores(scores)
+
+
+# ---------------------------
+# Compiled crop-rule index
+# ---------------------------
+RULES_VERSION_KEY = "rules_version"
+
+
+class CompiledRule(NamedTuple):
+    """Active CropRule with parsed thresholds; duck-types as a rule for score_crop()."""
+
+    id: int
+    name: str
+    temp_min: float
+    temp_max: float
+    rain_min: float
+    rain_max: float
+
+
+def _active_rules(session: Session) -> List[CropRule]:
+    return session.exec(select(CropRule).where(CropRule.active == True)).all()
+
+
+def read_rules_version(session: Session) -> int:
+    return read_app_state(session, RULES_VERSION_KEY)
+
+
+def bump_rules_version(session: Session) -> None:
+    """Mark the rule set as changed; call inside the transaction that changes it."""
+    bump_app_state(session, RULES_VERSION_KEY)
+
+
+class RuleIndex(PeriodicFlusher):
+    """Process-wide season -> rules table built from the active CropRules.
+
+    Workers notice changes made elsewhere by comparing the ``rules_version``
+    stamp from a background thread every ``interval`` seconds; the worker
+    that made the change reloads immediately. Lookups are pure in-memory
+    reads and never touch the database, so async routes can call them.
+    """
+
+    name = "rule-index-refresher"
+
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self.version = -1
+        # (season -> rules, season -> (N, 4) thresholds), swapped as one reference
+        self._tables: Tuple[Dict[str, Tuple[CompiledRule, ...]], Dict[str, np.ndarray]] = ({}, {})
+
+    def _build(self, session: Session, version: int) -> None:
+        buckets: Dict[str, List[CompiledRule]] = {}
+        for r in _active_rules(session):
+            cr = CompiledRule(r.id, r.name, float(r.temp_min), float(r.temp_max), float(r.rain_min), float(r.rain_max))
+            for season in {s.strip() for s in r.seasons_csv.split(",") if s.strip()}:
+                buckets.setdefault(season, []).append(cr)
+        self._tables = (
+            {season: tuple(rules) for season, rules in buckets.items()},
+            {season: rule_thresholds(rules) for season, rules in buckets.items()},
+        )
+        self.version = version
+
+    def reload(self) -> None:
+        with self._lock, Session(engine) as session:
+            self._build(session, read_rules_version(session))
+
+    def flush(self) -> int:
+        """Rebuild if another worker changed the rules; returns 1 when it did."""
+        with self._lock, Session(engine) as session:
+            version = read_rules_version(session)
+            if version == self.version:
+                return 0
+            self._build(session, version)
+            return 1
+
+    def for_season(self, season: str) -> Tuple[CompiledRule, ...]:
+        return self._tables[0].get(season, ())
+
+    def tables(self) -> Tuple[Dict[str, Tuple[CompiledRule, ...]], Dict[str, np.ndarray]]:
+        """(season -> rules, season -> thresholds) for every season, from one build."""
+        return self._tables
+
+
+rule_index = RuleIndex(interval=RULES_VERSION_CHECK_INTERVAL)
+
+
+# ---------------------------
+# Spatial place index (lat/lon grid)
+# ---------------------------
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class PlaceIndex:
+    """In-memory grid over PlaceCache coordinates for radius and nearest lookups.
+
+    Places are bucketed into fixed lat/lon cells (~5.5 km at the default
+    size), so a query only measures the places in the cells its radius
+    overlaps, however many rows the table has. Inserts made by this worker
+    are added directly; rows inserted by other workers are loaded by id, at
+    most once per ``check_interval`` seconds (place ids only grow).
+    """
+
+    def __init__(self, check_interval: float, cell_deg: float = 0.05):
+        self.check_interval = check_interval
+        self.cell_deg = cell_deg
+        self.size = 0
+        self.max_id = 0  # highest id loaded from the table
+        self._cells: Dict[Tuple[int, int], List[Tuple[int, float, float]]] = {}
+        self._recent: set = set()  # ids added locally above max_id; skipped by the next load
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _add_locked(self, place_id: int, lat: float, lon: float) -> None:
+        self._cells.setdefault(self._cell(lat, lon), []).append((place_id, lat, lon))
+        self.size += 1
+
+    def add(self, place_id: int, lat: float, lon: float) -> None:
+        with self._lock:
+            if place_id > self.max_id and place_id not in self._recent:
+                self._add_locked(place_id, lat, lon)
+                self._recent.add(place_id)
+
+    def _load_new(self, session: Session) -> None:
+        table = PlaceCache.__table__.c
+        stmt = select(table.id, table.lat, table.lon).where(table.id > self.max_id).order_by(table.id)
+        for place_id, lat, lon in session.exec(stmt.execution_options(yield_per=10000)):
+            if place_id not in self._recent:
+                self._add_locked(place_id, lat, lon)
+            self.max_id = place_id
+        self._recent = {i for i in self._recent if i > self.max_id}
+        self._checked_at = time.monotonic()
+
+    def reload(self) -> None:
+        with self._lock, Session(engine) as session:
+            self._cells, self._recent, self.size, self.max_id = {}, set(), 0, 0
+            self._load_new(session)
+
+    def _refresh_if_stale(self) -> None:
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            with Session(engine) as session:
+                self._load_new(session)
+
+    def within(self, lat: float, lon: float, radius_km: float, limit: int) -> List[Tuple[float, int]]:
+        """Up to ``limit`` (distance_km, place_id) pairs within the radius, nearest first."""
+        self._refresh_if_stale()
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = min(180.0, dlat / max(math.cos(math.radians(min(89.9, abs(lat) + dlat))), 1e-6))
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+        found = []
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                for place_id, plat, plon in self._cells.get((i, j), ()):
+                    d = haversine_km(lat, lon, plat, plon)
+                    if d <= radius_km:
+                        found.append((d, place_id))
+        return heapq.nsmallest(limit, found)
+
+    def nearest(self, lat: float, lon: float, max_km: float) -> Optional[Tuple[float, int]]:
+        hits = self.within(lat, lon, max_km, 1)
+        return hits[0] if hits else None
+
+
+place_index = PlaceIndex(check_interval=PLACE_INDEX_REFRESH_INTERVAL)
+
+
+# ---------------------------
+# Place name index (prefix autocomplete)
+# ---------------------------
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def fold_place_name(text: str) -> str:
+    """normalize_place_query() without punctuation: "Guntur, Andhra Pradesh, IN" -> "guntur andhra pradesh"."""
+    return _NON_WORD.sub(" ", normalize_place_query(text)).strip()
+
+
+class PlaceNameIndex(PeriodicFlusher):
+    """Sorted word-prefix index over PlaceCache names and the optional gazetteer.
+
+    Every word start of a folded name is a key ("guntur andhra pradesh",
+    "andhra pradesh", "pradesh"), so a query is one bisect plus a scan of the
+    keys sharing its prefix. Matches at the start of the name rank above
+    matches on a later word, then by hits, then shorter names. Every
+    ``interval`` seconds a background thread picks up PlaceCache rows added
+    by other workers (by id), merges keys queued by add() and re-reads the
+    hit counts, so search() never touches the database; names are
+    deduplicated, with cached places taking precedence over the gazetteer.
+    """
+
+    name = "place-name-refresher"
+
+    def __init__(self, interval: float, gazetteer_path: Optional[str] = None):
+        super().__init__(interval)
+        self.gazetteer_path = gazetteer_path
+        self.max_id = 0
+        self.local_hits = 0  # /geocode answered here
+        self.upstream_misses = 0  # /geocode sent to OpenWeather
+        self._entries: List[Tuple[str, float, float]] = []  # (name, lat, lon)
+        self._hits: List[int] = []  # per entry; replaced as a whole on refresh
+        self._keys: List[Tuple[str, int, bool]] = []  # (folded suffix, entry, starts mid-name)
+        self._names: Dict[str, int] = {}
+        self._queued: list = []  # keys from add(), merged by the next flush()
+
+    def _add_locked(self, name: str, lat: float, lon: float, hits: int, keys: list) -> None:
+        if name in self._names:
+            return
+        entry = self._names[name] = len(self._entries)
+        self._entries.append((name, lat, lon))
+        self._hits.append(hits)
+        folded = fold_place_name(name)
+        for m in re.finditer(r"\S+", folded):
+            keys.append((folded[m.start():], entry, m.start() > 0))
+
+    def add(self, name: str, lat: float, lon: float, hits: int = 0) -> None:
+        """Queue a place stored by this worker; searchable after the refresher's next pass (woken now)."""
+        with self._lock:
+            self._add_locked(name, lat, lon, hits, self._queued)
+        self._wake.set()
+
+    def _load_new(self, session: Session, keys: list) -> None:
+        table = PlaceCache.__table__.c
+        stmt = (select(table.id, table.name, table.lat, table.lon, table.hits)
+                .where(table.id > self.max_id).order_by(table.id))
+        for place_id, name, lat, lon, hits in session.exec(stmt.execution_options(yield_per=10000)):
+            self._add_locked(name, lat, lon, hits, keys)
+            self.max_id = place_id
+
+    def _load_gazetteer(self, keys: list) -> None:
+        if not self.gazetteer_path or not os.path.exists(self.gazetteer_path):
+            return
+        with open(self.gazetteer_path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                try:
+                    lat, lon = float(row["lat"]), float(row["lon"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                name = _display_name({"name": (row.get("name") or "").strip(),
+                                      "state": (row.get("state") or "").strip(), "country": "IN"})
+                self._add_locked(name, lat, lon, 0, keys)
+
+    def _load_hits(self, session: Session) -> None:
+        table = PlaceCache.__table__.c
+        hits = list(self._hits)
+        for name, n in session.exec(select(table.name, table.hits).where(table.hits > 0)):
+            entry = self._names.get(name)
+            if entry is not None:
+                hits[entry] = n
+        self._hits = hits
+
+    def reload(self) -> None:
+        keys: list = []
+        with self._lock, Session(engine) as session:
+            self._entries, self._hits, self._names, self._queued, self.max_id = [], [], {}, [], 0
+            self._load_new(session, keys)
+            self._load_gazetteer(keys)
+            keys.sort()
+            self._keys = keys
+
+    def flush(self) -> int:
+        """Index new PlaceCache rows and queued keys, refresh hits; returns the number of new keys."""
+        with self._lock:
+            keys, self._queued = self._queued, []
+            with Session(engine) as session:
+                self._load_new(session, keys)
+                self._load_hits(session)
+            if keys:
+                # Merge into a new list and swap it in: searches keep reading the old one meanwhile
+                self._keys = list(heapq.merge(self._keys, sorted(keys)))
+        return len(keys)
+
+    def search(self, query: str, limit: int) -> List[dict]:
+        q = fold_place_name(query)
+        if not q:
+            return []
+        keys, entries, hits = self._keys, self._entries, self._hits
+        best: Dict[int, tuple] = {}
+        i = bisect_left(keys, (q,))
+        for key, entry, mid_name in keys[i:i + GEOCODE_LOCAL_SCAN]:
+            if not key.startswith(q):
+                break
+            name = entries[entry][0]
+            rank = (mid_name, -hits[entry], len(name), name)
+            if entry not in best or rank < best[entry]:
+                best[entry] = rank
+        ranked = sorted(best, key=best.__getitem__)[:limit]
+        return [{"name": entries[e][0], "lat": entries[e][1], "lon": entries[e][2]} for e in ranked]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "keys": len(self._keys),
+                "local_hits": self.local_hits, "upstream_misses": self.upstream_misses}
+
+
+place_names = PlaceNameIndex(interval=PLACE_INDEX_REFRESH_INTERVAL, gazetteer_path=GAZETTEER_PATH)
+
+
+# ---------------------------
+# Recommendations (memoized per forecast) & cache warmer
+# ---------------------------
+def _crop_entry(r: CompiledRule, season: str, summ: dict, score: float, tag: str) -> dict:
+    return {
+        "crop": r.name,
+        "season": season,
+        "avg_temp_c": round(summ["avg_temp_c"], 2) if isinstance(summ["avg_temp_c"], (int, float)) else None,
+        "total_rain_mm": round(summ["total_rain_mm"], 2) if isinstance(summ["total_rain_mm"], (int, float)) else None,
+        "score": score,
+        "tag": tag,
+        "rule": {"temp_min": r.temp_min, "temp_max": r.temp_max, "rain_min": r.rain_min, "rain_max": r.rain_max},
+    }
+
+
+def live_recommendation(series: ForecastSeries, season: Optional[str] = None,
+                        horizon_h: int = FORECAST_DEFAULT_HORIZON) -> dict:
+    """Forecast summary, season and ranked crops for one cached forecast.
+
+    Memoized on the identity of the cached series, so repeat calls for a
+    warm place cost a dictionary lookup. A new forecast, a new month or
+    a rule change produces a new key. The returned dict is shared: do not
+    mutate it.
+    """
+    month = datetime.now().month
+    key = (id(series), season, horizon_h, month, rule_index.version)
+    hit = recommendation_cache.get(key)
+    if hit is not None and hit[0] is series:
+        return hit[1]
+
+    summ = series.summary(horizon_h)
+    chosen = season or dynamic_season(month, summ["avg_temp_c"], summ["total_rain_mm"])
+    crops = []
+    for r in rule_index.for_season(chosen):
+        sc = score_crop(r, summ["avg_temp_c"], summ["total_rain_mm"])
+        crops.append(_crop_entry(r, chosen, summ, sc, tag_for_score(sc)))
+    crops.sort(key=lambda x: x["score"], reverse=True)
+    result = {"month": month, "season": chosen, "horizon_h": horizon_h, "metrics": summ, "crops": crops}
+    recommendation_cache.set(key, (series, result))
+    return result
+
+
+def _top_places(session: Session, limit: int) -> List[PlaceCache]:
+    return session.exec(select(PlaceCache).order_by(PlaceCache.hits.desc(), PlaceCache.id.desc()).limit(limit)).all()
+
+
+class CacheWarmer:
+    """Keeps forecasts and recommendations for the most-hit places in memory.
+
+    Every ``interval`` seconds (+/- ``jitter``, so workers drift apart) it
+    takes the top ``top_n`` PlaceCache rows by hits and refreshes forecasts
+    that are missing or in the last fifth of their TTL, spending at most
+    ``max_upstream`` OpenWeather calls per cycle, then precomputes the
+    dynamic season and ranked crops for each season. A StoredForecast row
+    that another worker fetched recently is used instead of calling
+    upstream, so workers do not each refetch the same cells.
+    """
+
+    def __init__(self, interval: float, jitter: float, top_n: int, max_upstream: int):
+        self.interval = interval
+        self.jitter = jitter
+        self.top_n = top_n
+        self.max_upstream = max_upstream
+        self._task: Optional[asyncio.Task] = None
+        self.cycles = 0
+        self.last_fetched = 0
+
+    def _next_delay(self) -> float:
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def run_once(self) -> int:
+        places = await run_in_threadpool(_in_session, _top_places, self.top_n)
+        refresh_ahead = forecast_cache.ttl / 5
+        fetched = 0
+        for p in places:
+            cell = forecast_cell(p.lat, p.lon)
+            remaining = forecast_cache.expires_in(cell)
+            if remaining is None or remaining < refresh_ahead:
+                stored = await run_in_threadpool(_in_session, _stored_series, cell)
+                if stored is not None and FORECAST_CACHE_TTL - stored.age() >= refresh_ahead:
+                    forecast_cache.set(cell, stored)
+                elif fetched >= self.max_upstream:
+                    continue
+                else:
+                    fetched += 1
+                    try:
+                        forecast_cache.set(cell, await fetch_forecast_async(cell))
+                    except HTTPException:
+                        continue
+            series = forecast_cache.peek(cell)
+            if series is None:
+                continue
+            live_recommendation(series)
+            for season in rule_index.tables()[0]:
+                live_recommendation(series, season)
+        self.cycles += 1
+        self.last_fetched = fetched
+        return fetched
+
+    async def _loop(self) -> None:
+        await asyncio.sleep(random.uniform(1, 5))  # warm soon after boot, not all workers at once
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                pass
+            await asyncio.sleep(self._next_delay())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+cache_warmer = CacheWarmer(
+    interval=WARMER_INTERVAL,
+    jitter=WARMER_JITTER,
+    top_n=WARMER_TOP_N,
+    max_upstream=WARMER_MAX_UPSTREAM,
+)
+
+
+# ---------------------------
+# Response encoding (orjson, gzip/brotli negotiation)
+# ---------------------------
+def dump_json(content: Any) -> bytes:
+    """orjson encoding: datetimes as ISO 8601, numpy scalars and arrays as numbers."""
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def _accepted_codings(header: str) -> Dict[str, float]:
+    codings = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[name.strip().lower()] = q
+    return codings
+
+
+def negotiate_encoding(header: Optional[str]) -> Optional[str]:
+    """"br" (when brotli is installed) or "gzip" from Accept-Encoding; None for identity."""
+    if not header:
+        return None
+    codings = _accepted_codings(header)
+    wildcard = codings.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in (("br", "gzip") if brotli is not None else ("gzip",)):
+        q = codings.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def encoded_json(content: Any, encoding: Optional[str], headers: Optional[Dict[str, str]] = None,
+                 status_code: int = 200) -> Response:
+    """orjson body, compressed with ``encoding`` once it reaches COMPRESS_MIN_BYTES."""
+    body = dump_json(content)
+    headers = dict(headers or {})
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        body = brotli.compress(body, quality=BROTLI_QUALITY) if encoding == "br" else gzip.compress(body, GZIP_LEVEL, mtime=0)
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code, headers=headers, media_type="application/json")
+
+
+def json_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """Data-route response: orjson, negotiated compression, no jsonable_encoder/pydantic pass."""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    return encoded_json(content, encoding, {"Vary": "Accept-Encoding"}, status_code)
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: orjson instead of stdlib json for dict-returning routes."""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
 # ---------------------------
 # App
 # ---------------------------
-app = FastAPI(title=APP_TITLE)
+app = FastAPI(title=APP_TITLE, default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
-@app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
-    # Seed default crop rules once (if empty)
+@app.on_event("shutdown")
+async def on_shutdown():
+    await upstream.aclose()
+    await cache_warmer.stop()
+    place_hits.stop()
+    event_buffer.stop()
+    analytics_janitor.stop()
+    rule_index.stop()
+    place_names.stop()
+    password_hasher.shutdown()
+
+
+def seed_default_rules() -> None:
+    """Seed the default crop rules once (if the table is empty)."""
     with Session(engine) as session:
         any_rule = session.exec(select(CropRule)).first()
         if not any_rule:
@@ -316,9 +2463,30 @@ def on_startup():
                         active=True,
                     )
                 )
+            bump_rules_version(session)
             session.commit()
 
 
+@app.on_event("startup")
+def on_startup():
+    create_db_and_tables()
+    place_hits.start()
+    event_buffer.start()
+    analytics_janitor.start()
+    seed_default_rules()
+    rule_index.reload()
+    rule_index.start()
+    place_index.reload()
+    place_names.reload()
+    place_names.start()
+
+
+@app.on_event("startup")
+async def start_cache_warmer():
+    if WARMER_ENABLED:
+        cache_warmer.start()
+
+
 # ---------------------------
 # Health
 # ---------------------------
@@ -327,69 +2495,381 @@ def health():
     return {"status": "ok", "service": "CropWise API (dynamic)"}
 
 
+def _cache_gauge(field: str) -> Callable[[], List[Tuple[LabelSet, float]]]:
+    caches = {"forecast": forecast_cache, "auth": auth_cache, "recommendation": recommendation_cache}
+    return lambda: [((("cache", name),), getattr(c, field)) for name, c in caches.items()]
+
+
+metrics.gauge("cropwise_cache_hits_total", "Cache hits.", _cache_gauge("hits"), kind="counter")
+metrics.gauge("cropwise_cache_misses_total", "Cache misses.", _cache_gauge("misses"), kind="counter")
+metrics.gauge("cropwise_cache_coalesced_total", "Misses served by another in-flight load.",
+              _cache_gauge("coalesced"), kind="counter")
+metrics.gauge("cropwise_cache_entries", "Entries currently cached.", lambda: [
+    ((("cache", "forecast"),), forecast_cache.stats()["size"]),
+    ((("cache", "auth"),), auth_cache.stats()["size"]),
+    ((("cache", "recommendation"),), recommendation_cache.stats()["size"]),
+])
+metrics.gauge("cropwise_analytics_queue_pending", "Analytics events waiting to be written.",
+              lambda: [((), event_buffer.stats()["pending"])])
+metrics.gauge("cropwise_analytics_dropped_total", "Analytics events dropped because the queue was full.",
+              lambda: [((), event_buffer.stats()["dropped"])], kind="counter")
+metrics.gauge("cropwise_password_hash_pending", "bcrypt operations running or queued.",
+              lambda: [((), password_hasher.stats()["pending"])])
+
+
+def _threadpool_samples() -> List[Tuple[LabelSet, float]]:
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return [
+        ((("state", "busy"),), stats.borrowed_tokens),
+        ((("state", "waiting"),), stats.tasks_waiting),
+        ((("state", "capacity"),), stats.total_tokens),
+    ]
+
+
+metrics.gauge("cropwise_threadpool", "Sync worker threadpool: busy threads, queued tasks, capacity.", _threadpool_samples)
+
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # async so the threadpool gauge reads this worker's event-loop limiter
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats", tags=["health"])
+def cache_stats():
+    return {
+        "forecast": forecast_cache.stats(),
+        "auth": auth_cache.stats(),
+        "recommendation": recommendation_cache.stats(),
+        "warmer": {"enabled": WARMER_ENABLED, "cycles": cache_warmer.cycles, "last_fetched": cache_warmer.last_fetched},
+        "analytics_queue": event_buffer.stats(),
+        "analytics_store": analytics_store.stats(),
+        "geocode": place_names.stats(),
+    }
+
+
 # ---------------------------
 # Auth
 # ---------------------------
-@app.post("/auth/signup", response_model=Token, tags=["auth"])
-def signup(data: UserCreate):
-    with Session(engine) as session:
-        if get_user_by_username(session, data.username):
-            raise HTTPException(400, "Username already exists")
-        user = User(username=data.username, hashed_password=hash_password(data.password))
-        # make first user or 'admin' an admin
-        first_user = session.exec(select(User)).first()
-        if first_user is None or data.username.lower() == "admin":
-            user.is_admin = True
-        session.add(user)
+def _create_user(session: Session, username: str, hashed_password: str) -> User:
+    user = User(username=username, hashed_password=hashed_password)
+    # make first user or 'admin' an admin
+    first_user = session.exec(select(User)).first()
+    if first_user is None or username.lower() == "admin":
+        user.is_admin = True
+    session.add(user)
+    try:
         session.commit()
-        token = create_access_token({"sub": user.username})
-        return {"access_token": token, "token_type": "bearer"}
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(400, "Username already exists")
+    session.refresh(user)
+    return user
+
+
+@app.post("/auth/signup", response_model=Token, tags=["auth"])
+async def signup(data: UserCreate):
+    if await run_in_threadpool(_in_session, get_user_by_username, data.username):
+        raise HTTPException(400, "Username already exists")
+    hashed = await password_hasher.hash(data.password)
+    user = await run_in_threadpool(_in_session, _create_user, data.username, hashed)
+    token = create_access_token({"sub": user.username})
+    return FastJSONResponse({"access_token": token, "token_type": "bearer"})  # response_model is for the docs only
 
 
 @app.post("/auth/login", response_model=Token, tags=["auth"])
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    with Session(engine) as session:
-        user = get_user_by_username(session, form_data.username)
-        if not user or not verify_password(form_data.password, user.hashed_password):
-            raise HTTPException(401, "Invalid credentials")
-        token = create_access_token({"sub": user.username})
-        return {"access_token": token, "token_type": "bearer"}
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await run_in_threadpool(_in_session, get_user_by_username, form_data.username)
+    if not user or not await password_hasher.verify(form_data.password, user.hashed_password):
+        raise HTTPException(401, "Invalid credentials")
+    token = create_access_token({"sub": user.username})
+    return FastJSONResponse({"access_token": token, "token_type": "bearer"})  # response_model is for the docs only
+
+
+@app.get("/auth/stats", tags=["health"])
+def auth_stats():
+    return {"password_hashing": password_hasher.stats()}
 
 
 @app.get("/me", tags=["auth"])
-def me(user: User = Depends(get_current_user)):
+def me(user: CurrentUser = Depends(get_current_user)):
     return {"id": user.id, "username": user.username, "is_admin": user.is_admin}
 
 
 # ---------------------------
 # Analytics (optional auth)
 # ---------------------------
+def _optional_user_id(request: Request) -> Optional[int]:
+    """Resolve the user from a bearer token if present; anonymous otherwise."""
+    auth = request.headers.get("authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    user = resolve_token(auth.replace("Bearer ", ""))
+    return user.id if user else None
+
+
+def _queue_events(events: List[EventIn], user_id: Optional[int]) -> int:
+    now = datetime.now(timezone.utc)
+    rows = []
+    for e in events:
+        place, season = event_dims(e.meta)
+        rows.append({
+            "user_id": user_id,
+            "event_name": e.event_name,
+            "meta_json": json.dumps(e.meta, separators=(",", ":"), default=str) if e.meta else None,
+            "created_at": now,
+            "place": place,
+            "season": season,
+        })
+    return event_buffer.add(rows)
+
+
 @app.post("/analytics/event", tags=["analytics"])
 def log_event(event: EventIn, request: Request):
-    # Try to resolve user from bearer token if present
-    user_id = None
-    try:
-        auth = request.headers.get("authorization", "")
-        if auth.startswith("Bearer "):
-            token = auth.replace("Bearer ", "")
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # Queued for the next batched insert; the response does not wait for the commit
+    queued = _queue_events([event], _optional_user_id(request))
+    return {"ok": True, "queued": queued}
+
+
+@app.post("/analytics/events", tags=["analytics"])
+def log_events(events: List[EventIn], request: Request):
+    if len(events) > ANALYTICS_BULK_MAX:
+        raise HTTPException(413, f"At most {ANALYTICS_BULK_MAX} events per request")
+    queued = _queue_events(events, _optional_user_id(request))
+    return {"ok": True, "queued": queued}
+
+
+# ---------------------------
+# Admin: analytics summary (reads EventRollup only)
+# ---------------------------
+ROLLUP_DEFAULT_SPAN = {"hour": timedelta(hours=48), "day": timedelta(days=30), "month": timedelta(days=365)}
+
+
+def _bucket_floor(period: str, t: datetime) -> datetime:
+    return dict(ROLLUP_PERIODS)[period](t)
+
+
+def _bucket_ceil(period: str, t: datetime) -> datetime:
+    start = _bucket_floor(period, t)
+    if start == t:
+        return t
+    if period == "hour":
+        return start + timedelta(hours=1)
+    if period == "day":
+        return start + timedelta(days=1)
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+
+def rollup_tiles(since: datetime, until: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """Cover [since, until) with the coarsest buckets: (period, start, end) ranges.
+
+    Hours up to the first midnight, days up to the first of a month, whole
+    months, then days and hours again up to ``until``; a year-long range is
+    about a dozen month rows per key instead of 365 day rows.
+    """
+    tiles = []
+    start = _bucket_floor("hour", since)
+    for period, boundary in (("hour", "day"), ("day", "month"), ("month", None), ("day", None), ("hour", None)):
+        if boundary is not None:
+            # leading edge: up to the next coarser boundary, whole buckets before until only
+            end = min(_bucket_ceil(boundary, start), _bucket_floor(period, until))
+        elif period == "hour":
+            end = until
         else:
-            payload = None
-        username = (payload or {}).get("sub")
-        if username:
-            with Session(engine) as session:
-                u = get_user_by_username(session, username)
-                if u:
-                    user_id = u.id
-    except Exception:
-        pass
+            end = _bucket_floor(period, until)  # trailing edge: whole buckets only
+        if end > start:
+            tiles.append((period, start, end))
+            start = end
+    return tiles
+
+
+@app.get("/admin/analytics/summary", tags=["admin"])
+def analytics_summary(
+    period: str = Query("day", pattern="^(hour|day|month)$", description="Bucket size of the series"),
+    since: Optional[datetime] = Query(None, description="UTC; default 48 h, 30 days or a year before until"),
+    until: Optional[datetime] = Query(None, description="UTC, exclusive; default now"),
+    event_name: Optional[str] = None,
+    top: int = Query(20, ge=1, le=PLACES_PAGE_MAX, description="Places to list"),
+    _: CurrentUser = Depends(require_admin),
+):
+    """Event counts by name, season, top places and per bucket, from the rollups alone.
+
+    The breakdowns add up the coarsest buckets that tile the range (see
+    rollup_tiles()), so their cost depends on the number of distinct keys,
+    not on the number of raw events or days.
+    """
+    until = _utc_naive(until or datetime.now(timezone.utc))
+    since = _bucket_floor(period, _utc_naive(since) if since else until - ROLLUP_DEFAULT_SPAN[period])
+    t = EventRollup.__table__.c
+    total = func.sum(t.count).label("n")
+
+    def scan(dim: str, col, tile_period: str, start: datetime, end: datetime):
+        stmt = select(col, total).where(t.period == tile_period, t.dim == dim, t.bucket >= start, t.bucket < end)
+        if event_name:
+            stmt = stmt.where(t.event_name == event_name)
+        return stmt.group_by(col)
+
+    def breakdown(session: Session, dim: str, col) -> List[Tuple[str, int]]:
+        counts: Dict[str, int] = {}
+        for tile in rollup_tiles(since, until):
+            for key, n in session.exec(scan(dim, col, *tile)):
+                counts[key] = counts.get(key, 0) + n
+        return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    with Session(engine) as session:
+        by_event = breakdown(session, "", t.event_name)
+        by_season = breakdown(session, "season", t.value)
+        places = breakdown(session, "place", t.value)[:top]
+        series = session.exec(scan("", t.bucket, period, since, until).order_by(t.bucket)).all()
+    return {
+        "period": period,
+        "since": since,
+        "until": until,
+        "event_name": event_name,
+        "total": sum(n for _, n in by_event),
+        "by_event": [{"event_name": k, "count": n} for k, n in by_event],
+        "by_season": [{"season": k, "count": n} for k, n in by_season],
+        "top_places": [{"place": k, "count": n} for k, n in places],
+        "series": [{"bucket": r.bucket, "count": r.n} for r in series],
+    }
+
+
+# ---------------------------
+# Admin: streaming export (NDJSON/CSV, optional gzip, resumable by id)
+# ---------------------------
+EVENT_EXPORT_FIELDS = ("id", "user_id", "event_name", "place", "season", "meta_json", "created_at")
+PLACE_EXPORT_FIELDS = ("id", "name", "lat", "lon", "hits", "created_at")
+
+
+class _CsvLine:
+    """File-like sink for csv.writer that keeps only the last formatted row."""
+
+    def write(self, line: str) -> None:
+        self.line = line
+
+
+def export_lines(records, fields: Tuple[str, ...], fmt: str):
+    """One text line per record: NDJSON objects, or CSV rows after a header."""
+    if fmt == "csv":
+        sink = _CsvLine()
+        writer = csv.writer(sink, lineterminator="\n")
+        writer.writerow(fields)
+        yield sink.line
+        for rec in records:
+            writer.writerow(["" if rec[f] is None else rec[f].isoformat() if isinstance(rec[f], datetime) else rec[f]
+                             for f in fields])
+            yield sink.line
+    else:
+        for rec in records:
+            out = {f: rec[f] for f in fields}
+            out["created_at"] = out["created_at"].isoformat()
+            yield json.dumps(out, separators=(",", ":"), default=str) + "\n"
+
+
+def export_chunks(lines, compress: bool):
+    """Join lines into ~EXPORT_CHUNK_BYTES chunks, gzip-compressing them on the fly if asked.
+
+    Only the current chunk is held in memory; the records come from a
+    server-side cursor, so an export of any size runs in constant memory.
+    """
+    gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buf: List[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buf.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(buf)
+            buf, size = [], 0
+            chunk = gz.compress(chunk) if gz else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buf)
+    if gz:
+        chunk = gz.compress(chunk) + gz.flush()
+    if chunk:
+        yield chunk
+
+
+def iter_places(since: Optional[datetime], until: Optional[datetime], after_id: int):
+    """PlaceCache rows as dicts in id order, read through a server-side cursor."""
+    t = PlaceCache.__table__.c
+    stmt = select(PlaceCache.__table__).where(t.id > after_id)
+    if since:
+        stmt = stmt.where(t.created_at >= _utc_naive(since))
+    if until:
+        stmt = stmt.where(t.created_at < _utc_naive(until))
+    with engine.connect() as conn:
+        for r in conn.execution_options(yield_per=10000).execute(stmt.order_by(t.id)):
+            yield dict(r._mapping)
+
+
+def export_response(name: str, records, fields: Tuple[str, ...], fmt: str, compress: bool) -> StreamingResponse:
+    filename = f"{name}.{fmt}" + (".gz" if compress else "")
+    media_type = "application/gzip" if compress else ("text/csv" if fmt == "csv" else "application/x-ndjson")
+    return StreamingResponse(
+        export_chunks(export_lines(records, fields, fmt), compress),  # sync: iterated in the threadpool
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 
+EXPORT_FORMAT_QUERY = Query("ndjson", pattern="^(ndjson|csv)$")
+EXPORT_AFTER_ID_QUERY = Query(0, ge=0, description="Resume: only rows with a larger id (the last id received)")
+EXPORT_GZIP_QUERY = Query(False, alias="gzip", description="Gzip the stream (a .gz download)")
+
+
+@app.get("/admin/export/events", tags=["admin"])
+def export_events(
+    format: str = EXPORT_FORMAT_QUERY,
+    since: Optional[datetime] = Query(None, description="UTC, inclusive"),
+    until: Optional[datetime] = Query(None, description="UTC, exclusive"),
+    after_id: int = EXPORT_AFTER_ID_QUERY,
+    event_name: Optional[str] = None,
+    place: Optional[str] = None,
+    season: Optional[str] = None,
+    compress: bool = EXPORT_GZIP_QUERY,
+    _: CurrentUser = Depends(require_admin),
+):
+    """Stream raw analytics events from every tier in id order.
+
+    An interrupted download is resumed by repeating the request with
+    ``after_id`` set to the id of the last complete line received.
+    """
+    records = analytics_store.iter_events(since, until, after_id, event_name=event_name, place=place, season=season)
+    return export_response("events", records, EVENT_EXPORT_FIELDS, format, compress)
+
+
+@app.get("/admin/export/places", tags=["admin"])
+def export_places(
+    format: str = EXPORT_FORMAT_QUERY,
+    since: Optional[datetime] = Query(None, description="created_at, UTC, inclusive"),
+    until: Optional[datetime] = Query(None, description="created_at, UTC, exclusive"),
+    after_id: int = EXPORT_AFTER_ID_QUERY,
+    compress: bool = EXPORT_GZIP_QUERY,
+    _: CurrentUser = Depends(require_admin),
+):
+    """Stream the PlaceCache table in id order; resumable like /admin/export/events."""
+    return export_response("places", iter_places(since, until, after_id), PLACE_EXPORT_FIELDS, format, compress)
+
+
+# ---------------------------
+# Admin: users
+# ---------------------------
+@app.put("/admin/users/{username}/admin", tags=["admin"])
+def set_admin(username: str, data: AdminFlagIn, _: CurrentUser = Depends(require_admin)):
     with Session(engine) as session:
-        rec = AnalyticsEvent(user_id=user_id, event_name=event.event_name, meta_json=str(event.meta) if event.meta else None)
-        session.add(rec)
+        u = get_user_by_username(session, username)
+        if not u:
+            raise HTTPException(404, "User not found")
+        u.is_admin = data.is_admin
+        session.add(u)
+        bump_app_state(session, AUTH_VERSION_KEY)  # other workers drop their cached tokens
         session.commit()
-        session.refresh(rec)
-        return {"ok": True, "id": rec.id}
+    # Cached tokens carry the old flag; drop them here so the change applies immediately
+    invalidate_user_auth(username)
+    return {"username": username, "is_admin": data.is_admin}
 
 
 # ---------------------------
@@ -410,14 +2890,14 @@ def _rule_to_out(r: CropRule) -> Dict[str, Any]:
 
 
 @app.get("/admin/crop_rules", response_model=List[CropRuleOut], tags=["admin"])
-def list_rules(_: User = Depends(require_admin)):
+def list_rules(_: CurrentUser = Depends(require_admin)):
     with Session(engine) as session:
         rs = session.exec(select(CropRule)).all()
     return [_rule_to_out(r) for r in rs]
 
 
 @app.post("/admin/crop_rules", response_model=CropRuleOut, tags=["admin"])
-def create_rule(data: CropRuleIn, _: User = Depends(require_admin)):
+def create_rule(data: CropRuleIn, _: CurrentUser = Depends(require_admin)):
     with Session(engine) as session:
         r = CropRule(
             name=data.name,
@@ -429,13 +2909,15 @@ def create_rule(data: CropRuleIn, _: User = Depends(require_admin)):
             active=data.active,
         )
         session.add(r)
+        bump_rules_version(session)
         session.commit()
         session.refresh(r)
-        return _rule_to_out(r)
+    rule_index.reload()
+    return _rule_to_out(r)
 
 
 @app.put("/admin/crop_rules/{rule_id}", response_model=CropRuleOut, tags=["admin"])
-def update_rule(rule_id: int, data: CropRuleIn, _: User = Depends(require_admin)):
+def update_rule(rule_id: int, data: CropRuleIn, _: CurrentUser = Depends(require_admin)):
     with Session(engine) as session:
         r = session.get(CropRule, rule_id)
         if not r:
@@ -446,61 +2928,258 @@ def update_rule(rule_id: int, data: CropRuleIn, _: User = Depends(require_admin)
         r.rain_min, r.rain_max = data.rain_min, data.rain_max
         r.active = data.active
         session.add(r)
+        bump_rules_version(session)
         session.commit()
         session.refresh(r)
-        return _rule_to_out(r)
+    rule_index.reload()
+    return _rule_to_out(r)
 
 
 @app.delete("/admin/crop_rules/{rule_id}", tags=["admin"])
-def delete_rule(rule_id: int, _: User = Depends(require_admin)):
+def delete_rule(rule_id: int, _: CurrentUser = Depends(require_admin)):
     with Session(engine) as session:
         r = session.get(CropRule, rule_id)
         if not r:
             raise HTTPException(404, "Rule not found")
         session.delete(r)
+        bump_rules_version(session)
         session.commit()
-        return {"ok": True}
+    rule_index.reload()
+    return {"ok": True}
+
+
+# ---------------------------
+# HTTP conditional caching
+# ---------------------------
+def make_etag(*parts: Any) -> str:
+    """Strong ETag over the inputs that fully determine a response body."""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return etag in {t.strip().removeprefix("W/") for t in header.split(",")}
+
+
+def _not_modified_since(header: Optional[str], last_modified: float) -> bool:
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(last_modified) <= since
+
+
+def conditional_json(request: Request, content: Any, etag: str, max_age: float,
+                     last_modified: Optional[float] = None) -> Response:
+    """JSON response with validators; 304 when the client's copy is current.
+
+    If-None-Match wins over If-Modified-Since, as RFC 9110 requires. Each
+    content coding is its own representation, so it gets its own strong ETag.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max(0, int(max_age))}", "Vary": "Accept-Encoding"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        if _etag_matches(inm, etag):
+            return Response(status_code=304, headers=headers)
+    elif last_modified is not None and _not_modified_since(request.headers.get("if-modified-since"), last_modified):
+        return Response(status_code=304, headers=headers)
+    return encoded_json(content, encoding, headers)
+
+
+def forecast_validators(place: PlaceCache, series: ForecastSeries, *extra: Any,
+                        uses_rules: bool = False) -> Tuple[str, float, Optional[float]]:
+    """(etag, max_age, last_modified) for a response derived from one cached forecast.
+
+    The body also depends on the current month, so Last-Modified is never
+    earlier than the start of it. Responses scored against the crop rules
+    (``uses_rules``) get no Last-Modified at all: a rule edit changes them
+    without a timestamp, and only the ETag tracks it.
+    """
+    now = datetime.now()
+    etag = make_etag(place.id, series.first_dt, series.fetched_at, rule_index.version, now.month, *extra)
+    max_age = forecast_cache.expires_in(forecast_cell(place.lat, place.lon)) or 0
+    if uses_rules:
+        return etag, max_age, None
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()
+    return etag, max_age, max(series.fetched_at, month_start)
 
 
 # ---------------------------
 # Places (dynamic)
 # ---------------------------
+def _display_name(x: dict) -> str:
+    bits = [x.get("name")]
+    if x.get("state"):
+        bits.append(x["state"])
+    if x.get("country"):
+        bits.append(x["country"])
+    return ", ".join([b for b in bits if b])
+
+
 @app.get("/geocode", tags=["data"])
-def geocode(query: str = Query(..., description="Place name, e.g., 'Guntur' or 'Guntur, AP'")):
-    results = ow_geocode(query, limit=5)
-    out = []
-    for x in results:
-        bits = [x.get("name")]
-        if x.get("state"):
-            bits.append(x["state"])
-        if x.get("country"):
-            bits.append(x["country"])
-        out.append({"name": ", ".join([b for b in bits if b]), "lat": x["lat"], "lon": x["lon"]})
-    return out
+async def geocode(request: Request, query: str = Query(..., description="Place name, e.g., 'Guntur' or 'Guntur, AP'")):
+    """Typeahead: cached places and the gazetteer first, OpenWeather only when nothing matches."""
+    local = place_names.search(query, limit=5)
+    if local:
+        place_names.local_hits += 1
+        return json_response(request, local)
+    place_names.upstream_misses += 1
+    results = await ow_geocode_async(query, limit=5)
+    return json_response(request, [{"name": _display_name(x), "lat": x["lat"], "lon": x["lon"]} for x in results])
+
+
+def _encode_cursor(hits: int, place_id: int) -> str:
+    return f"{hits}.{place_id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        hits, place_id = cursor.split(".")
+        return int(hits), int(place_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 @app.get("/states", tags=["data"])
-def list_cached_places():
+def list_cached_places(
+    request: Request,
+    limit: int = Query(PLACES_PAGE_DEFAULT, ge=1, le=PLACES_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    q: Optional[str] = Query(None, description="Case-insensitive name prefix"),
+):
+    """Most-used places first, keyset-paginated on (hits, id).
+
+    The body stays a plain list; when more rows exist the cursor for the next
+    page is returned in the X-Next-Cursor header (and a Link rel=next).
+    """
+    table = PlaceCache.__table__.c
+    stmt = (
+        select(table.id, table.name, table.lat, table.lon, table.hits)
+        .order_by(table.hits.desc(), table.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        hits, place_id = _decode_cursor(cursor)
+        stmt = stmt.where(or_(table.hits < hits, and_(table.hits == hits, table.id < place_id)))
+    if q and q.strip():
+        stmt = stmt.where(table.name.like(_escape_like(q.strip()) + "%", escape="\\"))
     with Session(engine) as session:
-        places = session.exec(select(PlaceCache).order_by(PlaceCache.hits.desc(), PlaceCache.id.desc())).all()
-        return [{"name": p.name, "lat": p.lat, "lon": p.lon, "hits": p.hits} for p in places]
+        rows = session.exec(stmt).all()
+
+    out = [{"name": r.name, "lat": r.lat, "lon": r.lon, "hits": r.hits} for r in rows[:limit]]
+    # Hit counts move constantly, so the validator is the listed content itself
+    etag = make_etag(limit, cursor, q, *((p["name"], p["hits"]) for p in out))
+    resp = conditional_json(request, out, etag, PLACES_MAX_AGE)
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last.hits, last.id)
+        resp.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        resp.headers["Link"] = f'<{next_url}>; rel="next"'
+    return resp
+
+
+@app.get("/nearby", tags=["data"])
+def nearby_places(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(NEARBY_RADIUS_DEFAULT, gt=0, le=NEARBY_RADIUS_MAX, description="Kilometres"),
+    limit: int = Query(PLACES_PAGE_DEFAULT, ge=1, le=PLACES_PAGE_MAX),
+):
+    """Cached places within ``radius`` km, nearest first."""
+    found = place_index.within(lat, lon, radius, limit)
+    rows = {}
+    if found:
+        table = PlaceCache.__table__.c
+        stmt = select(table.id, table.name, table.lat, table.lon, table.hits).where(
+            table.id.in_([place_id for _, place_id in found])
+        )
+        with Session(engine) as session:
+            rows = {r.id: r for r in session.exec(stmt)}
+    out = [
+        {"name": r.name, "lat": r.lat, "lon": r.lon, "hits": r.hits, "distance_km": round(d, 3)}
+        for d, r in ((d, rows.get(place_id)) for d, place_id in found)
+        if r is not None
+    ]
+    etag = make_etag(lat, lon, radius, limit, *((p["name"], p["hits"]) for p in out))
+    return conditional_json(request, out, etag, PLACES_MAX_AGE)
 
 
-def get_or_cache_place(session: Session, place: str) -> PlaceCache:
-    # Check cache
-    p = session.exec(select(PlaceCache).where(PlaceCache.name == place)).first()
-    if p:
-        p.hits += 1
-        session.add(p)
+_COUNTRY_SUFFIXES = {"in", "ind", "india"}
+
+
+def normalize_place_query(query: str) -> str:
+    """Fold case/whitespace and drop a trailing India country part.
+
+    "  Guntur ,Andhra  Pradesh, IN" -> "guntur, andhra pradesh"
+    """
+    parts = [" ".join(p.split()) for p in query.lower().split(",")]
+    parts = [p for p in parts if p]
+    if len(parts) > 1 and parts[-1] in _COUNTRY_SUFFIXES:
+        parts = parts[:-1]
+    return ", ".join(parts)
+
+
+def _find_place_by_alias(session: Session, alias: str) -> Optional[PlaceCache]:
+    return session.exec(
+        select(PlaceCache).join(PlaceAlias, PlaceAlias.place_id == PlaceCache.id).where(PlaceAlias.alias == alias)
+    ).first()
+
+
+def _add_alias(session: Session, alias: str, place_id: int) -> None:
+    if not alias:
+        return
+    session.add(PlaceAlias(alias=alias, place_id=place_id))
+    try:
         session.commit()
-        session.refresh(p)
+    except IntegrityError:
+        # Already mapped (possibly by a concurrent request) – first writer wins.
+        session.rollback()
+
+
+def _insert_place(session: Session, name: str, lat: float, lon: float) -> PlaceCache:
+    p = PlaceCache(name=name, lat=lat, lon=lon, hits=1)
+    session.add(p)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another request inserted the same place between our lookup and insert.
+        session.rollback()
+        p = session.exec(select(PlaceCache).where(PlaceCache.name == name)).one()
+        place_hits.incr(p.id)
         return p
+    session.refresh(p)
+    place_index.add(p.id, p.lat, p.lon)
+    place_names.add(p.name, p.lat, p.lon, p.hits)
+    return p
+
+
+def _cached_place(session: Session, key: str) -> Optional[PlaceCache]:
+    p = _find_place_by_alias(session, key)
+    if p:
+        place_hits.incr(p.id)
+    return p
+
 
-    # Not cached; geocode with India bias and prefer exact city match
-    results = ow_geocode(place, limit=5)
+def _store_geocoded_place(session: Session, place: str, key: str, results: List[dict]) -> PlaceCache:
     if not results:
         raise HTTPException(404, "Place not found")
 
+    # Prefer exact city match
     needle = place.split(",")[0].strip().lower()
     best = None
     for x in results:
@@ -509,80 +3188,161 @@ def get_or_cache_place(session: Session, place: str) -> PlaceCache:
             break
     if not best:
         best = results[0]
+    display = _display_name(best)
+
+    # A different spelling may already have cached this place under its display name
+    p = session.exec(select(PlaceCache).where(PlaceCache.name == display)).first()
+    if p is None and PLACE_SNAP_KM > 0:
+        # ...or a neighbouring spot close enough to share its forecast
+        near = place_index.nearest(best["lat"], best["lon"], PLACE_SNAP_KM)
+        if near is not None:
+            p = session.get(PlaceCache, near[1])
+    if p:
+        place_hits.incr(p.id)
+    else:
+        p = _insert_place(session, display, best["lat"], best["lon"])
 
-    bits = [best.get("name")]
-    if best.get("state"):
-        bits.append(best["state"])
-    if best.get("country"):
-        bits.append(best["country"])
-    display = ", ".join([b for b in bits if b])
-
-    p = PlaceCache(name=display, lat=best["lat"], lon=best["lon"], hits=1)
-    session.add(p)
-    session.commit()
+    _add_alias(session, key, p.id)
+    display_key = normalize_place_query(display)
+    if display_key != key:
+        _add_alias(session, display_key, p.id)
     session.refresh(p)
     return p
 
 
+def _in_session(fn: Callable[..., Any], *args: Any) -> Any:
+    with Session(engine) as session:
+        return fn(session, *args)
+
+
+async def resolve_place(place: str) -> PlaceCache:
+    """Cached place for a query, else geocode (India bias) and cache it: DB work on the threadpool."""
+    key = normalize_place_query(place)
+    p = await run_in_threadpool(_in_session, _cached_place, key)
+    if p:
+        return p
+    results = await ow_geocode_async(place, limit=5)
+    return await run_in_threadpool(_in_session, _store_geocoded_place, place, key, results)
+
+
 # ---------------------------
 # Season now (dynamic by weather)
 # ---------------------------
+HORIZON_QUERY = Query(FORECAST_DEFAULT_HORIZON, ge=FORECAST_STEP_HOURS, le=FORECAST_MAX_HORIZON,
+                      description="Hours of forecast to summarize, e.g. 24, 72 or 120")
+DAILY_QUERY = Query(False, description="Also return per-day forecast buckets")
+
+
 @app.get("/season_now", tags=["data"])
-def season_now(state: str = Query(..., description="Any place; geocoded live")):
-    with Session(engine) as session:
-        place = get_or_cache_place(session, state)
-        fc = ow_forecast(place.lat, place.lon)
-        summ = forecast_summary(fc)
-        month = datetime.now().month
-        season = dynamic_season(month, summ["avg_temp_c"], summ["total_rain_mm"])
-        return {
-            "state": place.name,
-            "lat": place.lat,
-            "lon": place.lon,
-            "month": month,
-            "season": season,
-            "metrics": summ,
-        }
+async def season_now(request: Request, state: str = Query(..., description="Any place; geocoded live"),
+                     horizon_h: int = HORIZON_QUERY, daily: bool = DAILY_QUERY):
+    place = await resolve_place(state)
+    series = await get_forecast_async(place.lat, place.lon)
+    rec = live_recommendation(series, horizon_h=horizon_h)
+    etag, max_age, last_modified = forecast_validators(place, series, "season_now", horizon_h, daily)
+    body = {
+        "state": place.name,
+        "lat": place.lat,
+        "lon": place.lon,
+        "month": rec["month"],
+        "season": rec["season"],
+        "horizon_h": horizon_h,
+        "metrics": rec["metrics"],
+    }
+    if daily:
+        body["daily"] = series.daily()
+    return conditional_json(request, body, etag, max_age, last_modified)
 
 
 # ---------------------------
-# Live crops (uses DB crop rules)
+# Live crops (uses compiled crop rules)
 # ---------------------------
 @app.get("/live_crops", tags=["data"])
-def live_crops(state: str, season: Optional[str] = None):
-    with Session(engine) as session:
-        place = get_or_cache_place(session, state)
-        fc = ow_forecast(place.lat, place.lon)
-        summ = forecast_summary(fc)
-
-        if season is None:
-            season = dynamic_season(datetime.now().month, summ["avg_temp_c"], summ["total_rain_mm"])
-
-        rules = session.exec(select(CropRule).where(CropRule.active == True)).all()
-        crops = []
-        for r in rules:
-            seasons = [s.strip() for s in r.seasons_csv.split(",") if s.strip()]
-            if season not in seasons:
-                continue
-            sc = score_crop(r, summ["avg_temp_c"], summ["total_rain_mm"])
-            crops.append(
-                {
-                    "crop": r.name,
-                    "season": season,
-                    "avg_temp_c": round(summ["avg_temp_c"], 2) if isinstance(summ["avg_temp_c"], (int, float)) else None,
-                    "total_rain_mm": round(summ["total_rain_mm"], 2) if isinstance(summ["total_rain_mm"], (int, float)) else None,
-                    "score": sc,
-                    "tag": ("Excellent" if sc >= 80 else "Good" if sc >= 60 else "Moderate" if sc >= 40 else "Low"),
-                    "rule": {"temp_min": r.temp_min, "temp_max": r.temp_max, "rain_min": r.rain_min, "rain_max": r.rain_max},
-                }
+async def live_crops(request: Request, state: str, season: Optional[str] = None,
+                     horizon_h: int = HORIZON_QUERY, daily: bool = DAILY_QUERY):
+    place = await resolve_place(state)
+    series = await get_forecast_async(place.lat, place.lon)
+    # Memoized per cached series: warm places cost no upstream call and no scoring
+    rec = live_recommendation(series, season, horizon_h)
+    etag, max_age, last_modified = forecast_validators(place, series, "live_crops", season, horizon_h, daily,
+                                                        uses_rules=True)
+    body = {
+        "state": place.name,
+        "lat": place.lat,
+        "lon": place.lon,
+        "season": rec["season"],
+        "horizon_h": horizon_h,
+        "metrics": rec["metrics"],
+        "crops": rec["crops"],
+    }
+    if daily:
+        body["daily"] = series.daily()
+    return conditional_json(request, body, etag, max_age, last_modified)
+
+
+# ---------------------------
+# Live crops (batch of places)
+# ---------------------------
+async def _batch_weather(item: BatchLocationIn, sem: asyncio.Semaphore, horizon_h: int) -> dict:
+    """Resolve one batch item to place + forecast summary (errors are returned, not raised)."""
+    try:
+        async with sem:
+            if item.place:
+                place = await resolve_place(item.place)
+                name, lat, lon = place.name, place.lat, place.lon
+            elif item.lat is not None and item.lon is not None:
+                if not (-90 <= item.lat <= 90 and -180 <= item.lon <= 180):
+                    raise HTTPException(422, "lat/lon out of range")
+                name, lat, lon = None, item.lat, item.lon
+            else:
+                raise HTTPException(422, "Each item needs 'place' or both 'lat' and 'lon'")
+            series = await get_forecast_async(lat, lon)
+        return {"state": name, "lat": lat, "lon": lon, "metrics": series.summary(horizon_h)}
+    except HTTPException as e:
+        return {"error": e.detail, "status": e.status_code}
+    except Exception:
+        # e.g. a DB OperationalError or an httpx transport error: fail this item, not the batch
+        logger.exception("live_crops/batch item failed: %r", item)
+        return {"error": "Internal error", "status": 500}
+
+
+@app.post("/live_crops/batch", tags=["data"])
+async def live_crops_batch(request: Request, data: LiveCropsBatchIn):
+    if len(data.items) > LIVE_CROPS_BATCH_MAX:
+        raise HTTPException(413, f"At most {LIVE_CROPS_BATCH_MAX} items per request")
+
+    sem = asyncio.Semaphore(LIVE_CROPS_BATCH_CONCURRENCY)
+    results = await asyncio.gather(*[_batch_weather(item, sem, data.horizon_h) for item in data.items])
+
+    # Group successful items by season, then score each group against one rule snapshot
+    month = datetime.now().month
+    by_season: Dict[str, List[int]] = {}
+    for i, res in enumerate(results):
+        res["index"] = i
+        if "error" in res:
+            continue
+        summ = res["metrics"]
+        res["season"] = data.season or dynamic_season(month, summ["avg_temp_c"], summ["total_rain_mm"])
+        by_season.setdefault(res["season"], []).append(i)
+
+    rules_by_season, thresholds_by_season = rule_index.tables()
+    for season, idxs in by_season.items():
+        rules = rules_by_season.get(season, ())
+        if rules:
+            scores, tags = score_batch(
+                thresholds_by_season[season],
+                [results[i]["metrics"]["avg_temp_c"] for i in idxs],
+                [results[i]["metrics"]["total_rain_mm"] for i in idxs],
             )
-        crops.sort(key=lambda x: x["score"], reverse=True)
+        for col, i in enumerate(idxs):
+            res = results[i]
+            crops = [
+                _crop_entry(r, season, res["metrics"], float(scores[row, col]), tags[row, col])
+                for row, r in enumerate(rules)
+            ]
+            crops.sort(key=lambda x: x["score"], reverse=True)
+            res["crops"] = crops
 
-        return {
-            "state": place.name,
-            "lat": place.lat,
-            "lon": place.lon,
-            "season": season,
-            "metrics": summ,
-            "crops": crops,
-        }
+    return json_response(
+        request, {"season": data.season, "horizon_h": data.horizon_h, "count": len(results), "results": results}
+    )
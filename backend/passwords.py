@@ -0,0 +1,27 @@
+"""bcrypt hashing, importable without the rest of the API.
+
+main.PasswordHasher submits these functions to spawned worker processes,
+which unpickle them by module name: keeping them out of main.py means a
+worker imports passlib only, not numpy, FastAPI, the database engine and
+every module-level cache.
+"""
+from __future__ import annotations
+
+import signal
+
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def init_worker() -> None:
+    # Ctrl-C reaches the whole process group; the parent shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def verify_password(plain: str, hashed: str) -> bool:
+    return pwd_context.verify(plain, hashed)
+
+
+def hash_password(plain: str) -> str:
+    return pwd_context.hash(plain)
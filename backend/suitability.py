@@ -0,0 +1,326 @@
+"""Offline crop-suitability tables for many places at once.
+
+Reads places (a ``place`` column) or coordinates (``lat``/``lon``) from a CSV,
+fetches weather with bounded concurrency, scores every row against the active
+crop rules on a process pool and streams the results in input order:
+
+    cd backend
+    python suitability.py villages.csv -o suitability.ndjson --workers 4 --concurrency 16
+    python suitability.py villages.csv -o suitability.csv --fixtures bench/fixtures
+    python suitability.py villages.csv -o suitability.ndjson --resume   # after a crash
+
+Live runs share the API's database (``DATABASE_URL``): geocodes and forecasts
+stored there are reused, and new ones are stored for the API. With
+``--fixtures DIR`` nothing leaves the machine and no geocode or forecast is
+stored: ``DIR/geocode.json`` maps lower-case names to geocoding results and
+forecasts come from ``DIR/forecast_<lat>_<lon>.json`` (cache-grid cell) or
+``DIR/forecast.json``. Either way the crop rules are read from that database,
+which is created and seeded with the default rules, as the API does, if needed.
+An optional ``id`` column is copied to the output.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import main
+from main import (
+    FORECAST_DEFAULT_HORIZON, FORECAST_MAX_HORIZON, FORECAST_STEP_HOURS,
+    CompiledRule, ForecastSeries, TTLCache, dynamic_season, score_crop, tag_for_score,
+)
+
+CSV_FIELDS = ["row", "id", "place", "lat", "lon", "season", "avg_temp_c", "total_rain_mm",
+              "crop", "score", "tag", "error"]
+
+
+# ---------------------------
+# Weather sources
+# ---------------------------
+class FixtureWeather:
+    """Geocodes and forecasts from recorded JSON files; no network, nothing stored."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        path = os.path.join(directory, "geocode.json")
+        self.geocode: Dict[str, List[dict]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.geocode = json.load(f)
+        self._series = TTLCache(ttl=float("inf"), maxsize=1024)  # path -> ForecastSeries
+
+    async def place(self, name: str) -> Tuple[str, float, float]:
+        results = self.geocode.get(name.split(",")[0].strip().lower())
+        if not results:
+            raise HTTPException(404, "Place not found")
+        return main._display_name(results[0]), results[0]["lat"], results[0]["lon"]
+
+    def _load(self, path: str) -> ForecastSeries:
+        with open(path, encoding="utf-8") as f:
+            return ForecastSeries.from_forecast(json.load(f))
+
+    async def forecast(self, lat: float, lon: float) -> ForecastSeries:
+        cell = main.forecast_cell(lat, lon)
+        path = os.path.join(self.directory, f"forecast_{cell[0]}_{cell[1]}.json")
+        if not os.path.exists(path):
+            path = os.path.join(self.directory, "forecast.json")
+        if not os.path.exists(path):
+            raise HTTPException(404, "No forecast fixture")
+        return self._series.get_or_load(path, lambda: self._load(path))
+
+
+class LiveWeather:
+    """OpenWeather through the API's caches and tables.
+
+    Geocodes are looked up by alias without counting a hit, so a nightly run
+    doesn't push every village to the top of the cache warmer's list.
+    """
+
+    async def place(self, name: str) -> Tuple[str, float, float]:
+        key = main.normalize_place_query(name)
+        p = await run_in_threadpool(main._in_session, main._find_place_by_alias, key)
+        if p is None:
+            results = await main.ow_geocode_async(name, limit=5)
+            p = await run_in_threadpool(main._in_session, main._store_geocoded_place, name, key, results)
+        return p.name, p.lat, p.lon
+
+    async def forecast(self, lat: float, lon: float) -> ForecastSeries:
+        return await main.get_forecast_async(lat, lon)
+
+
+def _parse_coord(value: Optional[str], low: float, high: float) -> Optional[float]:
+    if value is None or not value.strip():
+        return None
+    x = float(value)
+    if not low <= x <= high:
+        raise ValueError
+    return x
+
+
+async def prepare_row(weather, row_no: int, rec: Dict[str, str], sem: asyncio.Semaphore) -> dict:
+    """Input row -> {row, id, place, lat, lon, series} or {row, id, place, error}."""
+    out = {"row": row_no, "id": rec.get("id") or None, "place": (rec.get("place") or "").strip() or None}
+    try:
+        try:
+            lat = _parse_coord(rec.get("lat"), -90, 90)
+            lon = _parse_coord(rec.get("lon"), -180, 180)
+        except ValueError:
+            raise HTTPException(422, "lat/lon out of range")
+        async with sem:
+            if lat is None or lon is None:
+                if not out["place"]:
+                    raise HTTPException(422, "Each row needs 'place' or both 'lat' and 'lon'")
+                out["place"], lat, lon = await weather.place(out["place"])
+            out["series"] = await weather.forecast(lat, lon)
+        out["lat"], out["lon"] = lat, lon
+    except HTTPException as e:
+        out["error"] = str(e.detail)
+    except Exception as e:
+        # A bad fixture record or a DB/transport failure costs this row, not the run
+        out["error"] = f"{type(e).__name__}: {e}"
+    return out
+
+
+# ---------------------------
+# Scoring (runs in the process pool)
+# ---------------------------
+_rules: Dict[str, Tuple[CompiledRule, ...]] = {}
+_job: Dict[str, object] = {}
+
+
+def _init_worker(rules_by_season: Dict[str, Tuple[CompiledRule, ...]], season: Optional[str],
+                 horizon_h: int, month: int) -> None:
+    global _rules, _job
+    _rules = rules_by_season
+    _job = {"season": season, "horizon_h": horizon_h, "month": month}
+
+
+def score_rows(rows: List[dict]) -> List[dict]:
+    for row in rows:
+        series = row.pop("series", None)
+        if series is None:
+            continue
+        summ = series.summary(_job["horizon_h"])
+        avg_temp, total_rain = summ["avg_temp_c"], summ["total_rain_mm"]
+        season = _job["season"] or dynamic_season(_job["month"], avg_temp, total_rain)
+        crops = []
+        for r in _rules.get(season, ()):
+            sc = score_crop(r, avg_temp, total_rain)
+            crops.append({"crop": r.name, "score": sc, "tag": tag_for_score(sc)})
+        crops.sort(key=lambda x: x["score"], reverse=True)
+        row.update(
+            season=season,
+            avg_temp_c=round(avg_temp, 2) if avg_temp is not None else None,
+            total_rain_mm=round(total_rain, 2) if total_rain is not None else None,
+            crops=crops,
+        )
+    return rows
+
+
+# ---------------------------
+# Output + resume
+# ---------------------------
+def _row_of(line: bytes, fmt: str) -> Optional[int]:
+    try:
+        if fmt == "ndjson":
+            return int(json.loads(line)["row"])
+        return int(line.split(b",", 1)[0])
+    except (ValueError, KeyError, TypeError):
+        return None  # CSV header
+
+
+def resume_point(path: str, fmt: str) -> Tuple[int, int]:
+    """(first row to redo, byte offset to truncate to) for an interrupted output file.
+
+    Scans line by line, so memory stays flat. The last row found is redone:
+    in CSV it spans several lines and may have been cut short.
+    """
+    last_row, last_start, offset = None, 0, 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn write
+            row = _row_of(line, fmt)
+            if row is not None and row != last_row:
+                last_row, last_start = row, offset
+            offset += len(line)
+    if last_row is None:
+        return 1, 0
+    return last_row, last_start
+
+
+class ResultWriter:
+    def __init__(self, stream, fmt: str, header: bool):
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = csv.DictWriter(stream, CSV_FIELDS, extrasaction="ignore") if fmt == "csv" else None
+        if self._csv and header:
+            self._csv.writeheader()
+        self.rows = 0
+        self.errors = 0
+
+    def write(self, results: List[dict]) -> None:
+        for res in results:
+            self.rows += 1
+            self.errors += "error" in res
+            if self._csv is None:
+                self.stream.write(json.dumps(res, separators=(",", ":")) + "\n")
+            elif "error" in res or not res["crops"]:
+                self._csv.writerow(res)
+            else:
+                for crop in res["crops"]:
+                    self._csv.writerow({**res, **crop})
+        self.stream.flush()
+        if self.stream.fileno() > 2:
+            os.fsync(self.stream.fileno())  # a chunk on disk is a chunk we never redo
+
+
+# ---------------------------
+# Driver
+# ---------------------------
+def read_rows(path: str, start_row: int) -> Iterator[Tuple[int, Dict[str, str]]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row_no, rec in enumerate(csv.DictReader(f), start=1):
+            if row_no >= start_row:
+                yield row_no, {(k or "").strip().lower(): v for k, v in rec.items()}
+
+
+def chunks(it: Iterator, size: int) -> Iterator[list]:
+    batch = []
+    for x in it:
+        batch.append(x)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run(args, weather, writer: ResultWriter, start_row: int) -> None:
+    rules_by_season = main.rule_index.tables()[0]
+    month = args.month or datetime.now().month
+    sem = asyncio.Semaphore(args.concurrency)
+    loop = asyncio.get_running_loop()
+    in_flight: deque = deque()  # scoring futures, in input order
+    # Spawned, not forked: by now the event loop and the threadpool have threads running
+    with ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+        initargs=(rules_by_season, args.season, args.horizon_h, month),
+    ) as pool:
+        for batch in chunks(read_rows(args.input, start_row), args.chunk_size):
+            prepared = await asyncio.gather(*[prepare_row(weather, n, rec, sem) for n, rec in batch])
+            in_flight.append(loop.run_in_executor(pool, score_rows, prepared))
+            # Fetching the next chunk overlaps scoring of this one; the cap keeps memory flat
+            while len(in_flight) > args.workers * 2:
+                writer.write(await in_flight.popleft())
+        while in_flight:
+            writer.write(await in_flight.popleft())
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("input", help="CSV with a 'place' column or 'lat'/'lon' columns (optional 'id')")
+    ap.add_argument("-o", "--output", default="-", help="output file; '-' for stdout")
+    ap.add_argument("--format", choices=("ndjson", "csv"), default=None,
+                    help="default: from the output file extension, else ndjson")
+    ap.add_argument("--fixtures", default=None, help="directory of recorded geocode/forecast JSON")
+    ap.add_argument("--season", default=None, help="score every row for this season (default: dynamic)")
+    ap.add_argument("--month", type=int, default=None, help="month for the dynamic season (default: now)")
+    ap.add_argument("--horizon-h", type=int, default=FORECAST_DEFAULT_HORIZON,
+                    help=f"forecast hours to summarize ({FORECAST_STEP_HOURS}-{FORECAST_MAX_HORIZON})")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+    ap.add_argument("--concurrency", type=int, default=8, help="weather lookups in flight")
+    ap.add_argument("--chunk-size", type=int, default=256, help="rows per scoring task")
+    ap.add_argument("--resume", action="store_true", help="continue an interrupted output file")
+    args = ap.parse_args(argv)
+    if not FORECAST_STEP_HOURS <= args.horizon_h <= FORECAST_MAX_HORIZON:
+        ap.error(f"--horizon-h must be {FORECAST_STEP_HOURS}-{FORECAST_MAX_HORIZON}")
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "ndjson")
+    if args.resume and args.output == "-":
+        ap.error("--resume needs an output file")
+
+    main.create_db_and_tables()
+    main.seed_default_rules()
+    main.rule_index.reload()
+
+    start_row, header = 1, True
+    if args.resume and os.path.exists(args.output):
+        start_row, offset = resume_point(args.output, fmt)
+        with open(args.output, "r+b") as f:
+            f.truncate(offset)
+        header = offset == 0
+    stream = sys.stdout if args.output == "-" else open(
+        args.output, "a" if args.resume else "w", newline="", encoding="utf-8")
+    writer = ResultWriter(stream, fmt, header)
+    weather = FixtureWeather(args.fixtures) if args.fixtures else LiveWeather()
+
+    async def go() -> None:
+        try:
+            await run(args, weather, writer, start_row)
+        finally:
+            await main.upstream.aclose()
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(go())
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    print(f"{writer.rows} rows from row {start_row} ({writer.errors} errors) in "
+          f"{time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,42 @@
+"""Test setup: the app on a throwaway SQLite database, OpenWeather replaced by bench/fake_openweather.
+
+The environment is set before ``main`` is first imported, so the module
+level configuration picks it up.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, "bench")]
+
+import fake_openweather  # noqa: E402
+
+upstream, upstream_state = fake_openweather.serve(seed=1)
+_tmp = tempfile.mkdtemp(prefix="cropwise-test-")
+os.environ.update(
+    OPENWEATHER_BASE_URL=f"http://127.0.0.1:{upstream.server_port}",
+    OPENWEATHER_API_KEY="test",
+    DATABASE_URL=f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    WARMER_ENABLED="0",
+)
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    # "admin" is always created as an administrator
+    client.post("/auth/signup", json={"username": "admin", "password": "admin-password"})
+    r = client.post("/auth/login", data={"username": "admin", "password": "admin-password"})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
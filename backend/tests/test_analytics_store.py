@@ -0,0 +1,65 @@
+"""AnalyticsStore maintenance when several workers share one partition directory."""
+import gzip
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import main
+
+MONTH = 202401
+
+
+def _rows(n):
+    return [{"event_name": "page_view", "meta_json": None, "place": None, "season": None,
+             "created_at": datetime(2024, 1, 15, 12, i)} for i in range(n)]
+
+
+def _archived_ids(store):
+    with gzip.open(store._path(MONTH, "ndjson.gz"), "rt") as f:
+        return [json.loads(line)["id"] for line in f]
+
+
+def test_archived_partition_is_not_recreated_by_another_worker(tmp_path):
+    a = main.AnalyticsStore(str(tmp_path), hot_months=1, retention_months=0)
+    b = main.AnalyticsStore(str(tmp_path), hot_months=1, retention_months=0)
+    a.write(MONTH, _rows(3), batch_size=100)
+    assert b.engine_for(MONTH, create=False) is not None  # b has the partition open
+
+    a.maintain()
+    assert not os.path.exists(a._path(MONTH, "db"))
+    ids = _archived_ids(a)
+    assert len(ids) == 3
+
+    b.maintain()  # must not reopen, recreate or re-archive the month
+    assert not os.path.exists(b._path(MONTH, "db"))
+    assert _archived_ids(b) == ids
+    assert b.engine_for(MONTH, create=False) is None
+
+
+def test_read_path_never_creates_a_partition(tmp_path, monkeypatch):
+    store = main.AnalyticsStore(str(tmp_path), hot_months=1, retention_months=0)
+    # The file disappears between the existence check and the connect
+    monkeypatch.setattr(main.os.path, "exists", lambda p: True)
+    with pytest.raises(OperationalError):
+        store.engine_for(MONTH, create=False)
+    monkeypatch.undo()
+    assert not os.path.exists(store._path(MONTH, "db"))
+    assert store.engine_for(MONTH, create=False) is None
+
+
+def test_failed_upgrade_is_not_cached(tmp_path, monkeypatch):
+    store = main.AnalyticsStore(str(tmp_path), hot_months=1, retention_months=0)
+
+    def locked(eng):
+        raise OperationalError("upgrade", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(main, "_upgrade_partition", locked)
+    with pytest.raises(OperationalError):
+        store.engine_for(MONTH)
+    monkeypatch.undo()
+    store.write(MONTH, _rows(2), batch_size=100)
+    with store.engine_for(MONTH, create=False).connect() as conn:
+        assert conn.execute(main.select(main.func.count()).select_from(main.partition_events)).scalar() == 2
@@ -0,0 +1,98 @@
+"""/admin/analytics/summary must agree with counting the raw events."""
+import json
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import main
+
+EVENT = "summary-check"
+PLACES = ["Guntur", "Patna", "Nashik", "Indore"]
+SEASONS = ["Kharif", "Rabi", "Summer", None]
+START = datetime(2025, 1, 1)
+SPAN_S = 400 * 86400
+
+
+def _seed_events(rng: random.Random, n: int) -> list:
+    rows = []
+    for _ in range(n):
+        place, season = rng.choice(PLACES), rng.choice(SEASONS)
+        meta = {"place": place, "season": season} if season else {"place": place}
+        rows.append({
+            "user_id": None,
+            "event_name": EVENT,
+            "meta_json": json.dumps(meta),
+            "created_at": START + timedelta(seconds=rng.randrange(SPAN_S)),
+            "place": place,
+            "season": season,
+        })
+    # Flush on this thread with the background flusher stopped, so the rollups are complete
+    main.event_buffer.stop()
+    try:
+        main.event_buffer.add(rows)
+        main.event_buffer.flush()
+    finally:
+        main.event_buffer.start()
+    return rows
+
+
+def _expected(rows: list, period: str, since: datetime, until: datetime) -> list:
+    # The summary starts at the period bucket holding since and counts whole hours up to until
+    lo = main._bucket_floor(period, since)
+    hi = main._bucket_ceil("hour", until)
+    return [r for r in rows if lo <= r["created_at"] < hi]
+
+
+def test_summary_matches_raw_counts(client, admin_headers):
+    rng = random.Random(21)
+    rows = _seed_events(rng, 3000)
+    for _ in range(200):
+        period = rng.choice(["hour", "day", "month"])
+        since = START + timedelta(seconds=rng.randrange(SPAN_S))
+        max_span = {"hour": 3 * 86400, "day": 90 * 86400, "month": SPAN_S}[period]
+        until = since + timedelta(seconds=rng.randrange(3600, max_span))
+        r = client.get("/admin/analytics/summary", headers=admin_headers, params={
+            "period": period, "since": since.isoformat(), "until": until.isoformat(), "event_name": EVENT,
+        })
+        assert r.status_code == 200
+        body = r.json()
+        want = _expected(rows, period, since, until)
+        context = (period, since, until)
+        assert body["total"] == len(want), context
+        # The series is bucketed by period, so its last bucket runs to the end of that period
+        series_end = main._bucket_ceil(period, until)
+        assert sum(b["count"] for b in body["series"]) == \
+            sum(main._bucket_floor(period, since) <= r["created_at"] < series_end for r in rows), context
+        assert {e["season"]: e["count"] for e in body["by_season"]} == \
+            Counter(w["season"] for w in want if w["season"]), context
+        assert {e["place"]: e["count"] for e in body["top_places"]} == Counter(w["place"] for w in want), context
+
+
+def test_rollups_survive_a_failed_upsert(client, admin_headers, monkeypatch):
+    event = "rollup-retry"
+    rows = [{"user_id": None, "event_name": event, "meta_json": None, "created_at": datetime(2026, 2, 3, 4, 5),
+             "place": None, "season": None}] * 7
+    real_upsert = main.upsert_rollups
+
+    def locked(conn, counts):
+        raise main.OperationalError("INSERT", {}, Exception("database is locked"))
+
+    main.event_buffer.stop()
+    try:
+        main.event_buffer.add(rows)
+        monkeypatch.setattr(main, "upsert_rollups", locked)
+        try:
+            main.event_buffer.flush()
+        except main.OperationalError:
+            pass
+        assert main.event_buffer.stats()["rollups_pending"] > 0
+        monkeypatch.setattr(main, "upsert_rollups", real_upsert)
+        main.event_buffer.flush()
+        assert main.event_buffer.stats()["rollups_pending"] == 0
+    finally:
+        main.event_buffer.start()
+    r = client.get("/admin/analytics/summary", headers=admin_headers, params={
+        "period": "month", "since": "2026-02-01T00:00:00", "until": "2026-03-01T00:00:00", "event_name": event,
+    })
+    assert r.json()["total"] == 7
+    assert len(list(main.analytics_store.iter_events(event_name=event))) == 7
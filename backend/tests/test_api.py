@@ -0,0 +1,83 @@
+"""Data routes end to end, with OpenWeather served by bench/fake_openweather."""
+import httpx
+
+import main
+from conftest import upstream_state
+
+
+def test_health(client):
+    assert client.get("/").json()["status"] == "ok"
+
+
+def test_live_crops_ranks_rules_and_caches_the_forecast(client):
+    r = client.get("/live_crops", params={"state": "Vijayawada", "season": "Kharif"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["state"].startswith("Vijayawada")
+    assert body["season"] == "Kharif"
+    scores = [c["score"] for c in body["crops"]]
+    assert scores and scores == sorted(scores, reverse=True)
+
+    calls = dict(upstream_state.counts)
+    again = client.get("/live_crops", params={"state": "vijayawada ", "season": "Kharif"})
+    assert again.json() == body
+    assert upstream_state.counts == calls  # alias, place and forecast all served from cache
+
+    assert client.get("/live_crops", params={"state": "Vijayawada", "season": "Kharif"},
+                      headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_season_now_horizon_and_daily(client):
+    r = client.get("/season_now", params={"state": "Warangal", "horizon_h": 24, "daily": True})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["horizon_h"] == 24
+    assert body["season"] in {"Kharif", "Rabi", "Summer"}
+    assert body["daily"]
+    assert client.get("/season_now", params={"state": "Warangal", "horizon_h": 1}).status_code == 422
+
+
+def test_batch_mixes_places_coordinates_and_errors(client):
+    r = client.post("/live_crops/batch", json={"items": [{"place": "Nashik"}, {"lat": 18.5, "lon": 73.8}, {}]})
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert results[0]["state"].startswith("Nashik") and results[0]["crops"]
+    assert results[1]["state"] is None and results[1]["crops"]
+    assert results[2]["status"] == 422
+
+
+def test_upstream_failure_is_a_502(client, monkeypatch):
+    monkeypatch.setattr(upstream_state, "error_rate", 1.0)
+    r = client.get("/live_crops", params={"state": "Some Unknown Hamlet"})
+    assert r.status_code == 502
+
+
+def test_states_pagination_and_compression(client, monkeypatch):
+    for place in ("Ludhiana", "Coimbatore", "Mysuru"):
+        client.get("/season_now", params={"state": place})
+    main.place_hits.flush()
+    first = client.get("/states", params={"limit": 2})
+    assert len(first.json()) == 2
+    rest = client.get("/states", params={"limit": 500, "cursor": first.headers["X-Next-Cursor"]})
+    names = [p["name"] for p in first.json() + rest.json()]
+    assert len(names) == len(set(names))
+    monkeypatch.setattr(main, "COMPRESS_MIN_BYTES", 1)
+    gz = client.get("/states", params={"limit": 500}, headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert [p["name"] for p in gz.json()] == names
+
+
+def test_batch_unexpected_error_fails_only_that_item(client, monkeypatch):
+    real = main.get_forecast_async
+
+    async def flaky(lat, lon):
+        if lat == 10.0:
+            raise httpx.ConnectError("connection refused")
+        return await real(lat, lon)
+
+    monkeypatch.setattr(main, "get_forecast_async", flaky)
+    r = client.post("/live_crops/batch", json={"items": [{"lat": 10.0, "lon": 76.0}, {"place": "Nashik"}]})
+    assert r.status_code == 200
+    bad, good = r.json()["results"]
+    assert bad["status"] == 500 and "crops" not in bad
+    assert good["crops"]
@@ -0,0 +1,23 @@
+"""Demoting an admin in one worker revokes access cached by the others."""
+from sqlmodel import Session
+
+import main
+
+
+def test_admin_demotion_in_another_worker_clears_cached_tokens(client, admin_headers, monkeypatch):
+    client.post("/auth/signup", json={"username": "bob", "password": "bob-password"})
+    assert client.put("/admin/users/bob/admin", json={"is_admin": True}, headers=admin_headers).status_code == 200
+    token = client.post("/auth/login", data={"username": "bob", "password": "bob-password"}).json()["access_token"]
+    bob = {"Authorization": f"Bearer {token}"}
+    assert client.get("/admin/crop_rules", headers=bob).status_code == 200  # now cached as admin
+
+    # What set_admin does in a different worker: this process's cache is left alone
+    with Session(main.engine) as session:
+        user = main.get_user_by_username(session, "bob")
+        user.is_admin = False
+        session.add(user)
+        main.bump_app_state(session, main.AUTH_VERSION_KEY)
+        session.commit()
+    monkeypatch.setattr(main.auth_version, "check_interval", 0)
+
+    assert client.get("/admin/crop_rules", headers=bob).status_code == 403
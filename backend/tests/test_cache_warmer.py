@@ -0,0 +1,22 @@
+"""The cache warmer reuses forecasts other workers stored instead of refetching them."""
+import asyncio
+
+import main
+from conftest import upstream_state
+
+
+def test_warmer_loads_fresh_stored_forecast_without_upstream_call(client):
+    for _ in range(5):
+        assert client.get("/live_crops", params={"state": "Guntur"}).status_code == 200
+    main.place_hits.flush()
+    place = client.get("/states", params={"limit": 1}).json()[0]
+    assert place["name"].startswith("Guntur")
+
+    cell = main.forecast_cell(place["lat"], place["lon"])
+    main.forecast_cache.clear()  # this worker has nothing in memory; the DB row is fresh
+    calls = upstream_state.counts["forecast"]
+    warmer = main.CacheWarmer(interval=60, jitter=0, top_n=1, max_upstream=5)
+
+    assert asyncio.run(warmer.run_once()) == 0
+    assert upstream_state.counts["forecast"] == calls
+    assert main.forecast_cache.peek(cell) is not None
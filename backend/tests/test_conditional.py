@@ -0,0 +1,30 @@
+"""Conditional GETs: a rule edit must not be hidden behind a date-only revalidation."""
+from email.utils import formatdate
+
+
+def test_rule_change_is_not_a_304_by_date(client, admin_headers):
+    params = {"state": "Guntur", "season": "Kharif"}
+    first = client.get("/live_crops", params=params)
+    assert first.status_code == 200
+    assert "Last-Modified" not in first.headers
+    since = {"If-Modified-Since": formatdate(usegmt=True)}
+
+    r = client.post("/admin/crop_rules", headers=admin_headers,
+                    json={"name": "Conditional Sorghum", "seasons": ["Kharif"], "temp_min": -50, "temp_max": 60,
+                          "rain_min": 0, "rain_max": 5000})
+    assert r.status_code == 200
+
+    again = client.get("/live_crops", params=params, headers=since)
+    assert again.status_code == 200
+    assert len(again.json()["crops"]) == len(first.json()["crops"]) + 1
+    assert again.headers["ETag"] != first.headers["ETag"]
+    assert client.get("/live_crops", params=params,
+                      headers={"If-None-Match": again.headers["ETag"]}).status_code == 304
+
+
+def test_season_now_revalidates_by_date(client):
+    first = client.get("/season_now", params={"state": "Guntur"})
+    assert "Last-Modified" in first.headers
+    r = client.get("/season_now", params={"state": "Guntur"},
+                   headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert r.status_code == 304
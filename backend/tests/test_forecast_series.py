@@ -0,0 +1,26 @@
+"""ForecastSeries windows and day buckets carry no prefix-sum float noise."""
+import random
+from decimal import Decimal
+
+import main
+
+
+def test_windows_equal_exact_decimal_sums():
+    rng = random.Random(3)
+    n = 40
+    temps = [round(rng.uniform(-5, 45), 2) for _ in range(n)]
+    rains = [round(rng.uniform(0, 12), 2) if rng.random() < 0.6 else 0.0 for _ in range(n)]
+    temps[5] = float("nan")
+    series = main.ForecastSeries([1_700_000_000 + 10800 * k for k in range(n)], temps, rains, tz_offset=19800)
+
+    bounds = [(0, n)] + [(rng.randrange(n), rng.randrange(n)) for _ in range(200)]
+    for i, j in bounds:
+        if j <= i:
+            continue
+        got = series._summarize(i, j)
+        t = [Decimal(str(x)) for x in temps[i:j] if x == x]
+        assert got["total_rain_mm"] == float(sum(Decimal(str(x)) for x in rains[i:j]))
+        assert got["avg_temp_c"] == (float(sum(t)) / len(t) if t else None)
+
+    for day in series.daily():
+        assert day["total_rain_mm"] == round(day["total_rain_mm"], 2)
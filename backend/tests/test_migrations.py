@@ -0,0 +1,33 @@
+"""Migrations bring databases created by older code up to the current schema."""
+from sqlalchemy import create_engine, text
+
+import main
+
+
+def test_duplicate_places_are_merged_and_name_becomes_unique(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with eng.begin() as conn:
+        # placecache/placealias as the original code created them: name indexed but not unique
+        conn.exec_driver_sql(
+            "CREATE TABLE placecache (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, lat FLOAT NOT NULL, "
+            "lon FLOAT NOT NULL, hits INTEGER NOT NULL, created_at DATETIME NOT NULL)")
+        conn.exec_driver_sql("CREATE INDEX ix_placecache_name ON placecache (name)")
+        conn.exec_driver_sql(
+            "CREATE TABLE placealias (id INTEGER PRIMARY KEY, alias VARCHAR NOT NULL UNIQUE, place_id INTEGER NOT NULL)")
+        for pid, name, hits in [(1, "Guntur", 3), (2, "Patna", 1), (3, "Guntur", 4), (4, "Guntur", 2)]:
+            conn.execute(text("INSERT INTO placecache VALUES (:id, :name, 16.3, 80.4, :hits, '2024-01-01')"),
+                         {"id": pid, "name": name, "hits": hits})
+        for aid, alias, pid in [(1, "guntur", 1), (2, "guntur, ap", 3), (3, "gunturu", 4), (4, "patna", 2)]:
+            conn.execute(text("INSERT INTO placealias VALUES (:id, :alias, :pid)"), {"id": aid, "alias": alias, "pid": pid})
+
+    for _ in range(2):  # idempotent
+        with eng.begin() as conn:
+            main._merge_duplicate_places(conn)
+
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT id, name, hits FROM placecache ORDER BY id")).all() == \
+            [(1, "Guntur", 9), (2, "Patna", 1)]
+        assert conn.execute(text("SELECT alias, place_id FROM placealias ORDER BY id")).all() == \
+            [("guntur", 1), ("guntur, ap", 1), ("gunturu", 1), ("patna", 2)]
+        unique = {r[1]: r[2] for r in conn.exec_driver_sql("PRAGMA index_list(placecache)")}
+        assert unique["ix_placecache_name"] == 1
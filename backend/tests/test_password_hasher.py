@@ -0,0 +1,42 @@
+"""PasswordHasher survives a dead worker and leaves no processes behind."""
+import asyncio
+import os
+import signal
+
+import main
+
+
+def test_recovers_from_killed_worker_and_shuts_down_cleanly():
+    hasher = main.PasswordHasher(workers=1, max_pending=4, retry_after=1)
+
+    async def scenario():
+        hashed = await hasher.hash("secret")
+        pids = list(hasher._executor._processes)
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)  # as an OOM kill would
+        assert await hasher.verify("secret", hashed)
+        return pids + list(hasher._executor._processes)
+
+    pids = asyncio.run(scenario())
+    hasher.shutdown()
+    assert hasher._executor is None
+    for pid in pids:
+        assert not os.path.exists(f"/proc/{pid}") or open(f"/proc/{pid}/stat").read().split()[2] == "Z"
+
+
+def test_workers_do_not_import_the_app_and_timings_reach_metrics():
+    hasher = main.PasswordHasher(workers=1, max_pending=4, retry_after=1)
+
+    async def scenario():
+        await hasher.hash("secret")
+        pid = next(iter(hasher._executor._processes))
+        with open(f"/proc/{pid}/maps") as f:
+            return f.read()
+
+    try:
+        maps = asyncio.run(scenario())
+    finally:
+        hasher.shutdown()
+    assert "bcrypt" in maps
+    assert "numpy" not in maps  # main.py (numpy, FastAPI, SQLModel) was not imported
+    assert 'cropwise_password_hash_duration_seconds_count{op="hash"}' in main.metrics.render()
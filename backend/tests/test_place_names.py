@@ -0,0 +1,62 @@
+"""PlaceNameIndex: /geocode answers from memory; new places arrive through the refresher thread."""
+from sqlmodel import Session
+
+import main
+
+
+def test_search_does_not_touch_the_database_and_flush_adds_new_places(client, monkeypatch):
+    main.place_names.stop()  # refresh by hand below
+    try:
+        with Session(main.engine) as session:  # a place cached by another worker
+            session.add(main.PlaceCache(name="Zunheboto, Nagaland, IN", lat=26.0, lon=94.5, hits=1))
+            session.commit()
+
+        real_session = main.Session
+
+        def no_db(*args, **kwargs):
+            raise AssertionError("search opened a database session")
+
+        monkeypatch.setattr(main, "Session", no_db)
+        assert main.place_names.search("zunh", limit=5) == []
+        monkeypatch.setattr(main, "Session", real_session)
+
+        assert main.place_names.flush() > 0
+        assert [p["name"] for p in main.place_names.search("zunh", limit=5)] == ["Zunheboto, Nagaland, IN"]
+        r = client.get("/geocode", params={"query": "Nagaland"})
+        assert r.json()[0]["name"] == "Zunheboto, Nagaland, IN"
+    finally:
+        main.place_names.start()
+
+
+def test_ranking_follows_hits_counted_after_load(client):
+    main.place_names.stop()
+    try:
+        with Session(main.engine) as session:
+            session.add(main.PlaceCache(name="Kolasib, Mizoram, IN", lat=24.2, lon=92.7, hits=5))
+            session.add(main.PlaceCache(name="Kolar, Karnataka, IN", lat=13.1, lon=78.1, hits=1))
+            session.commit()
+        main.place_names.flush()
+        assert [p["name"] for p in main.place_names.search("kola", limit=5)][0] == "Kolasib, Mizoram, IN"
+
+        with Session(main.engine) as session:  # Kolar gets popular in other workers
+            session.exec(main.update(main.PlaceCache).where(main.PlaceCache.name == "Kolar, Karnataka, IN")
+                         .values(hits=50))
+            session.commit()
+        assert main.place_names.flush() == 0
+        assert [p["name"] for p in main.place_names.search("kola", limit=5)][0] == "Kolar, Karnataka, IN"
+    finally:
+        main.place_names.start()
+
+
+def test_add_queues_keys_for_the_refresher(client):
+    main.place_names.stop()
+    try:
+        before = list(main.place_names._keys)
+        main.place_names.add("Yingkiong, Arunachal Pradesh, IN", 28.6, 95.0)
+        assert main.place_names._keys == before
+        assert main.place_names.flush() == 3
+        assert main.place_names._keys == sorted(main.place_names._keys)
+        assert [p["name"] for p in main.place_names.search("arunachal", limit=5)] == \
+            ["Yingkiong, Arunachal Pradesh, IN"]
+    finally:
+        main.place_names.start()
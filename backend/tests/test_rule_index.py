@@ -0,0 +1,29 @@
+"""RuleIndex: lookups stay in memory; the refresher thread picks up changes from other workers."""
+from sqlmodel import Session
+
+import main
+
+
+def test_lookups_do_not_touch_the_database(client, monkeypatch):
+    def no_db(*args, **kwargs):
+        raise AssertionError("rule lookup opened a database session")
+
+    monkeypatch.setattr(main, "Session", no_db)
+    assert main.rule_index.for_season("Kharif")
+    assert main.rule_index.tables()[0]["Rabi"]
+
+
+def test_refresh_picks_up_rules_changed_elsewhere(client):
+    main.rule_index.stop()  # refresh by hand below
+    try:
+        with Session(main.engine) as session:
+            session.add(main.CropRule(name="Refresh Millet", seasons_csv="Summer", temp_min=20, temp_max=40,
+                                      rain_min=0, rain_max=50))
+            main.bump_rules_version(session)  # as a different worker's admin route would
+            session.commit()
+        assert "Refresh Millet" not in {r.name for r in main.rule_index.for_season("Summer")}
+        assert main.rule_index.flush() == 1
+        assert "Refresh Millet" in {r.name for r in main.rule_index.for_season("Summer")}
+        assert main.rule_index.flush() == 0
+    finally:
+        main.rule_index.start()
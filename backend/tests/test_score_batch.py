@@ -0,0 +1,34 @@
+"""score_batch() must match the score_crop()/tag_for_score() reference exactly."""
+import random
+
+import main
+
+
+def test_score_batch_matches_reference():
+    rng = random.Random(7)
+    rules = []
+    for i in range(50):
+        tmin = round(rng.uniform(-5, 35), rng.choice((0, 1, 2)))
+        rmin = round(rng.uniform(0, 300), rng.choice((0, 1, 2)))
+        rules.append(main.CropRule(name=f"r{i}", seasons_csv="Kharif", temp_min=tmin,
+                                   temp_max=tmin + round(rng.uniform(0, 15), 1),
+                                   rain_min=rmin, rain_max=rmin + round(rng.uniform(0, 400), 1)))
+    def sample(lo, hi):
+        if rng.random() < 0.02:
+            return None
+        if rng.random() < 0.5:
+            # on a 1/800 grid the weighted sum often lands on a .xx5 midpoint
+            return round(round(rng.uniform(lo, hi) * 800) / 800, 5)
+        return round(rng.uniform(lo, hi), rng.choice((1, 2, 3)))
+
+    temps = [sample(-15, 55) for _ in range(5000)]
+    rains = [sample(0, 900) for _ in range(5000)]
+
+    scores, tags = main.score_batch(main.rule_thresholds(rules), temps, rains)
+
+    assert scores.shape == tags.shape == (50, 5000)
+    for i, rule in enumerate(rules):
+        for j, (t, r) in enumerate(zip(temps, rains)):
+            expected = main.score_crop(rule, t, r)
+            assert scores[i, j] == expected, (rule, t, r)
+            assert tags[i, j] == main.tag_for_score(expected)
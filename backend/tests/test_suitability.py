@@ -0,0 +1,28 @@
+"""suitability.py end to end in --fixtures mode: bad rows become error rows, the run completes."""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+
+def test_fixture_run_writes_errors_per_row(tmp_path):
+    fixtures = tmp_path / "fixtures"
+    shutil.copytree(os.path.join(BACKEND_DIR, "bench", "fixtures"), fixtures)
+    geocode = json.loads((fixtures / "geocode.json").read_text())
+    geocode["nowhere"] = [{"name": "Nowhere", "country": "IN"}]  # record without lat/lon
+    (fixtures / "geocode.json").write_text(json.dumps(geocode))
+    (tmp_path / "in.csv").write_text("id,place,lat,lon\na,Guntur,,\nb,Nowhere,,\nc,,17.4,78.5\nd,Atlantis,,\n")
+
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'cli.db'}")
+    subprocess.run([sys.executable, "suitability.py", str(tmp_path / "in.csv"), "-o", str(tmp_path / "out.ndjson"),
+                    "--fixtures", str(fixtures), "--workers", "2", "--chunk-size", "2"],
+                   cwd=BACKEND_DIR, env=env, check=True, capture_output=True, timeout=120)
+
+    rows = [json.loads(line) for line in (tmp_path / "out.ndjson").read_text().splitlines()]
+    assert [r["id"] for r in rows] == ["a", "b", "c", "d"]
+    assert rows[0]["crops"] and rows[2]["crops"]
+    assert rows[1]["error"].startswith("KeyError")
+    assert rows[3]["error"] == "Place not found"
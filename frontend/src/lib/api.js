@@ -46,8 +46,13 @@ export const api = {
   async me() {
     return fetchJSON(`${BASE}/me`, { headers: { ...authHeaders() } });
   },
-  async states() {
-    return fetchJSON(`${BASE}/states`);
+  async states({ limit, q, cursor } = {}) {
+    const qs = new URLSearchParams();
+    if (limit) qs.set("limit", limit);
+    if (q) qs.set("q", q);
+    if (cursor) qs.set("cursor", cursor);
+    const query = qs.toString();
+    return fetchJSON(`${BASE}/states${query ? `?${query}` : ""}`);
   },
   async geocode(query) {
     return fetchJSON(`${BASE}/geocode?query=${encodeURIComponent(query)}`);